@@ -0,0 +1,121 @@
+import logging
+import time
+from typing import Callable, Optional
+from uuid import UUID
+
+import numpy as np
+import orjson
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from redbox.models import ChatResponse
+
+log = logging.getLogger()
+
+
+def answer_cache_key(user_uuid: UUID) -> str:
+    """The Redis hash holding all of a user's cached answers, so they can be dropped at once"""
+    return f"redbox-answer-cache:{user_uuid}"
+
+
+def context_key(text_hashes: list[str]) -> str:
+    """Identifies the set of chunks an answer was given, whatever order they were retrieved in"""
+    return ",".join(sorted(text_hashes))
+
+
+class AnswerCache:
+    """A cache of RAG answers in Redis.
+
+    An answer is reused for a question from the same user whose embedding is within
+    similarity_threshold cosine similarity of the question it answered, when the same
+    chunks have been retrieved for it. Answers expire after ttl_seconds.
+
+    Each user's answers are kept in one hash, keyed by the chunks they were given, so
+    a lookup only reads the answers for the chunks just retrieved. At most
+    max_entries_per_context answers are kept for each, the oldest are dropped first.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl_seconds: int = 86_400,
+        similarity_threshold: float = 0.95,
+        max_entries_per_context: int = 8,
+    ):
+        self.redis = redis
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_context = max_entries_per_context
+
+    @staticmethod
+    def _unexpired(entries: list[dict]) -> list[dict]:
+        now = time.time()
+        return [entry for entry in entries if entry["expires_at"] > now]
+
+    async def _update_entries(
+        self, user_uuid: UUID, key: str, update: Callable[[list[dict]], list[dict]], refresh_ttl: bool = False
+    ) -> None:
+        """Replace the unexpired answers for the context key with update(answers)
+
+        The read and the write are one WATCH/MULTI transaction on the user's hash, retried if
+        another request changes the hash in between, so concurrent updates aren't lost.
+        """
+        name = answer_cache_key(user_uuid)
+
+        async def transaction(pipe: Pipeline) -> None:
+            value = await pipe.hget(name, key)
+            entries = update(self._unexpired(orjson.loads(value) if value is not None else []))
+            pipe.multi()
+            if entries:
+                pipe.hset(name, key, orjson.dumps(entries))
+            else:
+                pipe.hdel(name, key)
+            if refresh_ttl:
+                pipe.expire(name, self.ttl_seconds)
+
+        await self.redis.transaction(transaction, name)
+
+    async def get(
+        self, user_uuid: UUID, question_embedding: list[float], text_hashes: list[str]
+    ) -> Optional[ChatResponse]:
+        key = context_key(text_hashes)
+        value = await self.redis.hget(answer_cache_key(user_uuid), key)
+        if value is None:
+            return None
+
+        stored = orjson.loads(value)
+        entries = self._unexpired(stored)
+        if len(entries) < len(stored):
+            # drop the expired answers, keeping any answer put by another request in the meantime
+            await self._update_entries(user_uuid, key, lambda unexpired: unexpired)
+        if not entries:
+            return None
+
+        query = np.asarray(question_embedding, dtype=np.float32)
+        embeddings = np.asarray([entry["question_embedding"] for entry in entries], dtype=np.float32)
+        norms = np.maximum(np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query), 1e-12)
+        similarities = embeddings @ query / norms
+
+        best = int(np.argmax(similarities))
+        best_similarity = float(similarities[best])
+        if best_similarity < self.similarity_threshold:
+            return None
+
+        log.info("answer cache hit for user %s with similarity %.3f", user_uuid, best_similarity)
+        return ChatResponse.model_validate_json(entries[best]["response"])
+
+    async def put(
+        self, user_uuid: UUID, question_embedding: list[float], text_hashes: list[str], response: ChatResponse
+    ) -> None:
+        key = context_key(text_hashes)
+        entry = {
+            "question_embedding": question_embedding,
+            "response": response.model_dump_json(),
+            "expires_at": time.time() + self.ttl_seconds,
+        }
+        await self._update_entries(
+            user_uuid,
+            key,
+            lambda entries: [*entries, entry][-self.max_entries_per_context :],
+            refresh_ttl=True,
+        )
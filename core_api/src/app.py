@@ -1,11 +1,16 @@
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, RedirectResponse
 
+from core_api.src.routes import chat, file
 from core_api.src.routes.chat import chat_app
 from core_api.src.routes.file import file_app
 from redbox.models import Settings, StatusResponse
+from redbox.storage import get_async_storage_handler
 
 # === Logging ===
 
@@ -19,6 +24,30 @@ start_time = datetime.now()
 
 # Create API
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the chat models in the background if asked to, /ready reports when they are,
+    create the storage handler that the chat and file routes share, see core_api.src.storage,
+    and close the chat and file clients on shutdown.
+
+    The lifespans of mounted sub-apps are not run, so this is done here.
+    """
+    warm_up_task = asyncio.create_task(run_in_threadpool(chat.warm_up)) if env.warm_up else None
+    storage_handler = get_async_storage_handler(env, root_index="redbox-data")
+
+    yield {"storage_handler": storage_handler}
+
+    if warm_up_task is not None:
+        await warm_up_task
+    await chat.es.close()
+    if chat.answer_cache is not None:
+        await chat.answer_cache.redis.aclose()
+    await storage_handler.close()
+    if file.redis_client is not None:
+        await file.redis_client.aclose()
+
+
 app = FastAPI(
     title="Core API",
     description="Redbox Core API",
@@ -26,9 +55,11 @@ app = FastAPI(
     openapi_tags=[
         {"name": "health", "description": "Health check"},
     ],
+    lifespan=lifespan,
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -62,5 +93,23 @@ def health() -> StatusResponse:
     return output
 
 
+@app.get("/ready", tags=["health"])
+def ready(response: Response) -> StatusResponse:
+    """Returns whether the API is ready to serve chats, distinct from /health, which only
+    says it is up. When warm-up is on, that is once the embedding model has been loaded
+    and run, until then the status is "loading" with a 503.
+
+    Returns:
+        StatusResponse: The readiness of the API
+    """
+    uptime_seconds = (datetime.now() - start_time).total_seconds()
+
+    if env.warm_up and not chat.is_warm():
+        response.status_code = 503
+        return StatusResponse(status="loading", uptime_seconds=uptime_seconds, version=app.version)
+
+    return StatusResponse(status="ready", uptime_seconds=uptime_seconds, version=app.version)
+
+
 app.mount("/chat", chat_app)
 app.mount("/file", file_app)
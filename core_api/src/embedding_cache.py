@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from redbox.models import EmbeddingCacheInfo
+
+
+class QueryEmbeddingCache:
+    """A bounded least-recently-used cache of query embeddings, whose entries expire
+    after a time-to-live.
+
+    Entries are keyed on the embedding model name and the query text with its case and
+    whitespace normalised, so that repeated questions skip the embedding model.
+    """
+
+    def __init__(self, embedding_model: str, max_size: int = 1024, ttl_seconds: float = 3600.0):
+        self.embedding_model = embedding_model
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[float, list[float]]] = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def normalise(query: str) -> str:
+        return " ".join(query.split()).casefold()
+
+    def key(self, query: str) -> tuple[str, str]:
+        return self.embedding_model, self.normalise(query)
+
+    def get(self, query: str) -> Optional[list[float]]:
+        """Get the cached embedding of a query, counting a hit or a miss"""
+        key = self.key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding: list[float]) -> None:
+        """Cache the embedding of a query, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+
+        key = self.key(query)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> EmbeddingCacheInfo:
+        with self._lock:
+            return EmbeddingCacheInfo(
+                embedding_model=self.embedding_model,
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._entries),
+                max_size=self.max_size,
+                ttl_seconds=self.ttl_seconds,
+            )
@@ -1,23 +1,35 @@
+import asyncio
 import logging
-from typing import Annotated
+import time
+from functools import lru_cache
+from threading import Lock
+from typing import Annotated, AsyncIterator, Optional
 from uuid import UUID
 
+import orjson
+from elasticsearch.helpers.vectorstore import AsyncDenseVectorStrategy, AsyncVectorStore
 from fastapi import Depends, FastAPI, HTTPException
-from langchain.chains.llm import LLMChain
-from langchain.chains.qa_with_sources import load_qa_with_sources_chain
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from langchain_community.chat_models import ChatLiteLLM
 from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_elasticsearch import ApproxRetrievalStrategy, ElasticsearchStore
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate, format_document
+from redis.asyncio import Redis
 
+from core_api.src.answer_cache import AnswerCache
 from core_api.src.auth import get_user_uuid
+from core_api.src.embedding_cache import QueryEmbeddingCache
+from core_api.src.storage import AsyncStorageHandler, StorageHandler
+from redbox.llm.context_packing import document_text_hash, pack_documents
+from redbox.llm.llm_base import get_condense_question_chain, get_docs_with_sources_chain
 from redbox.llm.prompts.chat import (
-    CONDENSE_QUESTION_PROMPT,
     STUFF_DOCUMENT_PROMPT,
     WITH_SOURCES_PROMPT,
 )
+from redbox.llm.retrieval import maximal_marginal_relevance, reciprocal_rank_fusion
 from redbox.model_db import MODEL_PATH
-from redbox.models import EmbeddingModelInfo, Settings
+from redbox.models import EmbeddingCacheInfo, EmbeddingModelInfo, RerankInfo, Settings
 from redbox.models.chat import ChatMessage, ChatRequest, ChatResponse, SourceDocument
 
 # === Logging ===
@@ -40,16 +52,32 @@ chat_app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
 )
 
-log.info("Loading embedding model from environment: %s", env.embedding_model)
-embedding_model = SentenceTransformerEmbeddings(model_name=env.embedding_model, cache_folder=MODEL_PATH)
-log.info("Loaded embedding model from environment: %s", env.embedding_model)
+# the embedding model is loaded on first use, or by warm_up, so that importing this module,
+# e.g. in a replica that only serves /file, does not pay for it
+embedding_model_lock = Lock()
 
 
-def populate_embedding_model_info() -> EmbeddingModelInfo:
+@lru_cache
+def load_embedding_model() -> SentenceTransformerEmbeddings:
+    log.info("Loading embedding model from environment: %s", env.embedding_model)
+    embedding_model = SentenceTransformerEmbeddings(model_name=env.embedding_model, cache_folder=MODEL_PATH)
+    log.info("Loaded embedding model from environment: %s", env.embedding_model)
+    return embedding_model
+
+
+def get_embedding_model() -> SentenceTransformerEmbeddings:
+    # the lock stops concurrent first requests each loading their own copy
+    with embedding_model_lock:
+        return load_embedding_model()
+
+
+@lru_cache
+def get_embedding_model_info() -> EmbeddingModelInfo:
     test_text = "This is a test sentence."
-    embedding = embedding_model.embed_documents([test_text])[0]
+    embedding = get_embedding_model().embed_documents([test_text])[0]
     embedding_model_info = EmbeddingModelInfo(
         embedding_model=env.embedding_model,
         vector_size=len(embedding),
@@ -57,7 +85,37 @@ def populate_embedding_model_info() -> EmbeddingModelInfo:
     return embedding_model_info
 
 
-embedding_model_info = populate_embedding_model_info()
+def warm_up() -> None:
+    """Load the embedding model and run a first forward pass through it, so that the first
+    chat does not have to wait for either"""
+    get_embedding_model_info()
+
+
+def is_warm() -> bool:
+    return get_embedding_model_info.cache_info().currsize > 0
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    embedding_model=env.embedding_model,
+    max_size=env.query_embedding_cache_size,
+    ttl_seconds=env.query_embedding_cache_ttl_seconds,
+)
+
+
+async def embed_query(query: str) -> list[float]:
+    """Embed a query, reusing the embedding of an identical recent query if there is one"""
+    embedding = query_embedding_cache.get(query)
+    if embedding is None:
+        # the embedding model is CPU bound, so keep it off the event loop
+        embedding = await run_in_threadpool(lambda: get_embedding_model().embed_query(query))
+        query_embedding_cache.put(query, embedding)
+    return embedding
+
+
+@chat_app.get("/embedding/cache", tags=["embedding"])
+def get_query_embedding_cache_info() -> EmbeddingCacheInfo:
+    """Get the hit and miss counts and size of the query embedding cache"""
+    return query_embedding_cache.info()
 
 
 # === LLM setup ===
@@ -68,26 +126,49 @@ llm = ChatLiteLLM(
     streaming=True,
 )
 
-es = env.elasticsearch_client()
+condense_question_llm = ChatLiteLLM(model=env.condense_question_model) if env.condense_question_model else llm
+
+es = env.async_elasticsearch_client()
 if env.elastic.subscription_level == "basic":
-    strategy = ApproxRetrievalStrategy(hybrid=False)
+    strategy = AsyncDenseVectorStrategy(hybrid=False)
 elif env.elastic.subscription_level in ["platinum", "enterprise"]:
-    strategy = ApproxRetrievalStrategy(hybrid=True)
+    strategy = AsyncDenseVectorStrategy(hybrid=True)
 else:
     raise ValueError(f"Unknown Elastic subscription level {env.elastic.subscription_level}")
 
 
-vector_store = ElasticsearchStore(
-    es_connection=es,
-    index_name="redbox-data-chunk",
-    embedding=embedding_model,
-    strategy=strategy,
-    vector_query_field="embedding",
+CHUNK_INDEX = "redbox-data-chunk"
+RETRIEVAL_K = 4
+RETRIEVAL_NUM_CANDIDATES = 50
+RETRIEVAL_FIELDS = ["text", "metadata", "token_count", "text_hash"]
+
+vector_store = AsyncVectorStore(
+    client=es,
+    index=CHUNK_INDEX,
+    retrieval_strategy=strategy,
+    text_field="text",
+    vector_field="embedding",
 )
 
+rerank_info = RerankInfo()
+
+if env.answer_cache_enabled:
+    answer_cache: Optional[AnswerCache] = AnswerCache(
+        redis=Redis.from_url(env.redis_url),
+        ttl_seconds=env.answer_cache_ttl_seconds,
+        similarity_threshold=env.answer_cache_similarity_threshold,
+        max_entries_per_context=env.answer_cache_max_entries_per_context,
+    )
+else:
+    answer_cache = None
+
+# bounds the number of chats this process works on at once, so that a burst of requests
+# queues here rather than piling up on the LLM, Elasticsearch and the embedding model
+chat_semaphore = asyncio.Semaphore(env.chat_max_concurrency)
+
 
 @chat_app.post("/vanilla", tags=["chat"], response_model=ChatResponse)
-def simple_chat(chat_request: ChatRequest, _user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> ChatResponse:
+async def simple_chat(chat_request: ChatRequest, _user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> ChatResponse:
     """Get a LLM response to a question history"""
 
     if len(chat_request.message_history) < 2:
@@ -112,56 +193,261 @@ def simple_chat(chat_request: ChatRequest, _user_uuid: Annotated[UUID, Depends(g
     # Convert to LangChain style messages
     messages = chat_prompt.format_messages()
 
-    response = llm(messages)
+    async with chat_semaphore:
+        response = await llm.ainvoke(messages)
 
-    return ChatResponse(response_message=ChatMessage(text=response.text, role="ai"))
+    return ChatResponse(output_text=response.content)
 
 
-@chat_app.post("/rag", tags=["chat"])
-def rag_chat(chat_request: ChatRequest, user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> ChatResponse:
-    """Get a LLM response to a question history and file
+def hit_to_document(hit: dict) -> Document:
+    source = hit["_source"]
+    return Document(
+        page_content=source.get("text", ""),
+        metadata=(source.get("metadata") or {})
+        | {"token_count": source.get("token_count"), "text_hash": source.get("text_hash")},
+    )
 
-    Args:
 
+async def client_rrf_search(
+    question: str, query_vector: list[float], filters: list[dict], k: int, fields: list[str]
+) -> list[dict]:
+    """Search with BM25 and kNN in a single msearch and fuse the two rankings with
+    reciprocal rank fusion, hybrid search that does not need a platinum subscription"""
+    common = {"size": max(k, env.rrf_window_size), "_source": fields}
+    bm25_query = {"query": {"bool": {"must": [{"match": {"text": question}}], "filter": filters}}} | common
+    knn_query = {
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": max(k, env.rrf_window_size),
+            "num_candidates": max(RETRIEVAL_NUM_CANDIDATES, k, env.rrf_window_size),
+            "filter": filters,
+        }
+    } | common
+
+    response = await es.msearch(searches=[{"index": CHUNK_INDEX}, bm25_query, {"index": CHUNK_INDEX}, knn_query])
+
+    result_lists = []
+    for query_response in response["responses"]:
+        if "error" in query_response:
+            log.error("hybrid search query failed: %s", query_response["error"])
+            continue
+        result_lists.append(query_response["hits"]["hits"])
+
+    return reciprocal_rank_fusion(result_lists, rank_constant=env.rrf_rank_constant, size=k)
+
+
+def mmr_rerank(query_vector: list[float], hits: list[dict]) -> list[dict]:
+    """Keep the mmr_k of the hits that best balance relevance to the query against
+    similarity to each other, recording how long it took"""
+    # BM25 can match chunks that have not been embedded yet
+    hits = [hit for hit in hits if hit["_source"].get("embedding")]
+
+    start = time.perf_counter()
+    selected = maximal_marginal_relevance(
+        query_vector,
+        [hit["_source"]["embedding"] for hit in hits],
+        k=env.mmr_k,
+        lambda_mult=env.mmr_lambda,
+    )
+    seconds = time.perf_counter() - start
+
+    rerank_info.reranks += 1
+    rerank_info.total_seconds += seconds
+    rerank_info.last_seconds = seconds
+    log.info("MMR re-ranked %d chunks down to %d in %.2fms", len(hits), len(selected), seconds * 1000)
 
-    Returns:
-        StreamingResponse: a stream of the chain response
+    return [hits[i] for i in selected]
+
+
+@chat_app.get("/rerank", tags=["chat"])
+def get_rerank_info() -> RerankInfo:
+    """Get the number of times retrieved chunks have been re-ranked and the time spent on it"""
+    return rerank_info
+
+
+async def get_relevant_documents(
+    question: str, user_uuid: UUID, storage_handler: AsyncStorageHandler
+) -> list[Document]:
+    """Retrieve the user's chunks that are most relevant to the question
+
+    The storage handler is only searched for them when the storage backend isn't Elasticsearch.
+    """
+    query_vector = await embed_query(question)
+    filters = [{"term": {"creator_user_uuid.keyword": str(user_uuid)}}]
+
+    # with re-ranking, fetch more candidates, with their embeddings, to choose between
+    k = env.mmr_fetch_k if env.mmr_rerank else RETRIEVAL_K
+    fields = RETRIEVAL_FIELDS + ["embedding"] if env.mmr_rerank else RETRIEVAL_FIELDS
+
+    if env.storage_backend != "elasticsearch":
+        hits = await storage_handler.search_chunks(query_vector, user_uuid, k=k, fields=fields)
+    elif env.retrieval_mode == "client_rrf":
+        hits = await client_rrf_search(question, query_vector, filters, k=k, fields=fields)
+    else:
+        hits = await vector_store.search(
+            query=question,
+            query_vector=query_vector,
+            k=k,
+            num_candidates=max(RETRIEVAL_NUM_CANDIDATES, k),
+            fields=list(fields),
+            filter=filters,
+        )
+
+    if env.mmr_rerank:
+        hits = mmr_rerank(query_vector, hits)
+
+    return [hit_to_document(hit) for hit in hits]
+
+
+def needs_condensing(previous_history: list[ChatMessage]) -> bool:
+    """Whether the question needs rephrasing in the light of the history before it
+
+    With condense_question="follow_up" a first question, preceded by nothing but system
+    prompts, is already standalone, so the LLM round trip is skipped.
     """
+    if env.condense_question == "always":
+        return True
+    if env.condense_question == "never":
+        return False
+    return any(msg.role != "system" for msg in previous_history)
+
+
+async def get_standalone_question_and_documents(
+    chat_request: ChatRequest, user_uuid: UUID, storage_handler: AsyncStorageHandler
+) -> tuple[str, list[Document], int]:
+    """Rephrase the last question in the history as a standalone question and retrieve
+    the user's chunks that are most relevant to it, as many as fit in the context token
+    budget, along with the number of tokens they use"""
     question = chat_request.message_history[-1].text
     previous_history = list(chat_request.message_history[:-1])
-    previous_history = ChatPromptTemplate.from_messages(
-        (msg.role, msg.text) for msg in previous_history
-    ).format_messages()
-
-    docs_with_sources_chain = load_qa_with_sources_chain(
-        llm,
-        chain_type="stuff",
-        prompt=WITH_SOURCES_PROMPT,
-        document_prompt=STUFF_DOCUMENT_PROMPT,
-        verbose=True,
-    )
 
-    condense_question_chain = LLMChain(llm=llm, prompt=CONDENSE_QUESTION_PROMPT)
+    if needs_condensing(previous_history):
+        previous_history = ChatPromptTemplate.from_messages(
+            (msg.role, msg.text) for msg in previous_history
+        ).format_messages()
 
-    standalone_question = condense_question_chain({"question": question, "chat_history": previous_history})["text"]
+        condense_question_chain = get_condense_question_chain(condense_question_llm)
 
-    docs = vector_store.as_retriever(
-        search_kwargs={"filter": {"term": {"creator_user_uuid.keyword": str(user_uuid)}}}
-    ).get_relevant_documents(standalone_question)
+        condensed = await condense_question_chain.ainvoke({"question": question, "chat_history": previous_history})
+        standalone_question = condensed["text"]
+    else:
+        standalone_question = question
+
+    docs = await get_relevant_documents(standalone_question, user_uuid, storage_handler)
+    docs, context_token_count = pack_documents(docs, token_budget=env.rag_context_token_budget)
+
+    return standalone_question, docs, context_token_count
 
-    result = docs_with_sources_chain(
-        {
-            "question": standalone_question,
-            "input_documents": docs,
-        },
-    )
 
-    source_documents = [
+def get_source_documents(docs: list[Document]) -> list[SourceDocument]:
+    return [
         SourceDocument(
             page_content=langchain_document.page_content,
             file_uuid=langchain_document.metadata.get("parent_doc_uuid"),
             page_numbers=langchain_document.metadata.get("page_numbers"),
         )
-        for langchain_document in result.get("input_documents", [])
+        for langchain_document in docs
     ]
-    return ChatResponse(output_text=result["output_text"], source_documents=source_documents)
+
+
+@chat_app.post("/rag", tags=["chat"])
+async def rag_chat(
+    chat_request: ChatRequest, user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler
+) -> ChatResponse:
+    """Get a LLM response to a question history and file
+
+    Args:
+
+
+    Returns:
+        StreamingResponse: a stream of the chain response
+    """
+    async with chat_semaphore:
+        standalone_question, docs, context_token_count = await get_standalone_question_and_documents(
+            chat_request, user_uuid, storage_handler
+        )
+
+        if answer_cache is not None:
+            # already in the query embedding cache, from retrieval
+            question_embedding = await embed_query(standalone_question)
+            text_hashes = [document_text_hash(doc) for doc in docs]
+            if cached_response := await answer_cache.get(user_uuid, question_embedding, text_hashes):
+                return cached_response
+
+        docs_with_sources_chain = get_docs_with_sources_chain(llm)
+
+        result = await docs_with_sources_chain.ainvoke(
+            {
+                "question": standalone_question,
+                "input_documents": docs,
+            },
+        )
+
+    source_documents = get_source_documents(result.get("input_documents", []))
+    chat_response = ChatResponse(
+        output_text=result["output_text"],
+        source_documents=source_documents,
+        context_token_count=context_token_count,
+    )
+
+    if answer_cache is not None:
+        await answer_cache.put(user_uuid, question_embedding, text_hashes, chat_response)
+
+    return chat_response
+
+
+def server_sent_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@chat_app.post(
+    "/rag/stream",
+    tags=["chat"],
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "A stream of server-sent events"}},
+)
+async def rag_chat_stream(
+    chat_request: ChatRequest, user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler
+) -> StreamingResponse:
+    """Get a LLM response to a question history and file, streamed as server-sent events
+
+    Args:
+        chat_request (ChatRequest): The question history
+        user_uuid (UUID): The UUID of the user
+
+    Returns:
+        StreamingResponse: a `token` event, with a `text` field, for each token of the answer as
+            it is generated, followed by an `end` event with the full ChatResponse, or by an `error`
+            event, with a `detail` field, if generation fails part way through
+    """
+    async with chat_semaphore:
+        standalone_question, docs, context_token_count = await get_standalone_question_and_documents(
+            chat_request, user_uuid, storage_handler
+        )
+
+    # the same prompt that the "stuff" chain in rag_chat would build
+    summaries = "\n\n".join(format_document(doc, STUFF_DOCUMENT_PROMPT) for doc in docs)
+    prompt = WITH_SOURCES_PROMPT.format(question=standalone_question, summaries=summaries)
+
+    async def event_stream() -> AsyncIterator[str]:
+        output_text = ""
+        try:
+            async with chat_semaphore:
+                async for token in llm.astream(prompt):
+                    output_text += token.content
+                    yield server_sent_event("token", orjson.dumps({"text": token.content}).decode())
+        except Exception:
+            # the 200 status has already been sent, so the client is told in the stream instead
+            log.exception("failed to stream an answer for user %s", user_uuid)
+            yield server_sent_event("error", orjson.dumps({"detail": "failed to generate an answer"}).decode())
+            return
+
+        chat_response = ChatResponse(
+            output_text=output_text,
+            source_documents=get_source_documents(docs),
+            context_token_count=context_token_count,
+        )
+        yield server_sent_event("end", chat_response.model_dump_json())
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
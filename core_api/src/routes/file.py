@@ -1,24 +1,29 @@
 import logging
-from typing import Annotated
+from functools import lru_cache
+from typing import Annotated, Optional
 from uuid import UUID
 
 from elasticsearch import NotFoundError
-from fastapi import Depends, FastAPI, UploadFile
+from fastapi import Depends, FastAPI, HTTPException, Query, UploadFile
 from fastapi import File as FastAPIFile
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from faststream.redis.fastapi import RedisRouter
 from pydantic import BaseModel, Field
+from redis.asyncio import Redis
 
+from core_api.src.answer_cache import answer_cache_key
 from core_api.src.auth import get_user_uuid
 from core_api.src.publisher_handler import FilePublisher
-from redbox.models import APIError404, Chunk, File, FileStatus, Settings
-from redbox.storage import ElasticsearchStorageHandler
+from core_api.src.storage import StorageHandler
+from redbox.models import APIError404, Chunk, EmbeddingFormat, File, FileStatus, Settings
+from redbox.storage import MAX_CHUNK_STATUSES_WINDOW, ItemNotFoundError
 
 # === Functions ===
 
 
-def file_not_found_response(file_uuid: UUID) -> JSONResponse:
-    return JSONResponse(
+def file_not_found_response(file_uuid: UUID) -> ORJSONResponse:
+    return ORJSONResponse(
         status_code=404,
         content={
             "detail": "Item not found",
@@ -40,7 +45,10 @@ env = Settings()
 
 # === Object Store ===
 
-s3 = env.s3_client()
+
+@lru_cache
+def get_s3_client():
+    return env.s3_client()
 
 
 # === Queues ===
@@ -48,11 +56,7 @@ router = RedisRouter(url=env.redis_url)
 
 file_publisher = FilePublisher(router.broker, env.ingest_queue_name)
 
-# === Storage ===
-
-es = env.elasticsearch_client()
-storage_handler = ElasticsearchStorageHandler(es_client=es, root_index="redbox-data")
-
+redis_client = Redis.from_url(env.redis_url) if env.answer_cache_enabled else None
 
 file_app = FastAPI(
     title="Core File API",
@@ -64,6 +68,7 @@ file_app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=router.lifespan_context,
 )
 file_app.include_router(router)
@@ -76,7 +81,9 @@ class FileRequest(BaseModel):
 
 
 @file_app.post("/", tags=["file"], status_code=201)
-async def add_file(file_request: FileRequest, user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> File:
+async def add_file(
+    file_request: FileRequest, user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler
+) -> File:
     """Create a File record in the database
 
     Args:
@@ -89,7 +96,7 @@ async def add_file(file_request: FileRequest, user_uuid: Annotated[UUID, Depends
 
     file = File(key=file_request.key, bucket=env.bucket_name, creator_user_uuid=user_uuid)
 
-    storage_handler.write_item(file)
+    await storage_handler.write_item(file)
 
     log.info("publishing %s for %s", file.uuid, file.creator_user_uuid)
     await file_publisher.publish(file)
@@ -98,7 +105,7 @@ async def add_file(file_request: FileRequest, user_uuid: Annotated[UUID, Depends
 
 
 @file_app.get("/", tags=["file"])
-async def list_files(user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> list[File]:
+async def list_files(user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler) -> list[File]:
     """Gets a list of files in the database.
 
     Args:
@@ -107,14 +114,16 @@ async def list_files(user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> list
     Returns:
         Files (list, File): A list of file objects
     """
-    return storage_handler.read_all_items(model_type="File", user_uuid=user_uuid)
+    return await storage_handler.read_all_items(model_type="File", user_uuid=user_uuid)
 
 
 # Standard file upload endpoint for utility in quick testing
 if env.dev_mode:
 
     @file_app.post("/upload", tags=["file"], response_model=File)
-    async def upload_file(user_uuid: Annotated[UUID, Depends(get_user_uuid)], file: UploadFile = None) -> File:
+    async def upload_file(
+        user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler, file: UploadFile = None
+    ) -> File:
         """Upload a file to the object store
 
         Args:
@@ -125,10 +134,10 @@ if env.dev_mode:
         """
         file = file or FastAPIFile(...)
         key = file.filename
-        s3.upload_fileobj(file.file, env.bucket_name, key)
+        await run_in_threadpool(get_s3_client().upload_fileobj, file.file, env.bucket_name, key)
 
         file = File(key=key, bucket=env.bucket_name, creator_user_uuid=user_uuid)
-        storage_handler.write_item(file)
+        await storage_handler.write_item(file)
 
         log.info("publishing %s", file.uuid)
         await file_publisher.publish(file)
@@ -142,7 +151,9 @@ if env.dev_mode:
     tags=["file"],
     responses={404: {"model": APIError404, "description": "The file was not found"}},
 )
-def get_file(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> File:
+async def get_file(
+    file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler
+) -> File:
     """Get a file from the object store
 
     Args:
@@ -156,8 +167,8 @@ def get_file(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)]
         404: If the file isn't found, or the creator and requester don't match
     """
     try:
-        file = storage_handler.read_item(file_uuid, model_type="File")
-    except NotFoundError:
+        file = await storage_handler.read_item(file_uuid, model_type="File")
+    except (NotFoundError, ItemNotFoundError):
         return file_not_found_response(file_uuid=file_uuid)
 
     if file.creator_user_uuid != user_uuid:
@@ -172,7 +183,9 @@ def get_file(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)]
     tags=["file"],
     responses={404: {"model": APIError404, "description": "The file was not found"}},
 )
-def delete_file(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> File:
+async def delete_file(
+    file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)], storage_handler: StorageHandler
+) -> File:
     """Delete a file from the object store and the database
 
     Args:
@@ -186,18 +199,22 @@ def delete_file(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uui
         404: If the file isn't found, or the creator and requester don't match
     """
     try:
-        file = storage_handler.read_item(file_uuid, model_type="File")
-    except NotFoundError:
+        file = await storage_handler.read_item(file_uuid, model_type="File")
+    except (NotFoundError, ItemNotFoundError):
         return file_not_found_response(file_uuid=file_uuid)
 
     if file.creator_user_uuid != user_uuid:
         return file_not_found_response(file_uuid=file_uuid)
 
-    s3.delete_object(Bucket=env.bucket_name, Key=file.key)
-    storage_handler.delete_item(file)
+    await run_in_threadpool(get_s3_client().delete_object, Bucket=env.bucket_name, Key=file.key)
+    await storage_handler.delete_item(file)
+
+    chunks = await storage_handler.get_file_chunks(file.uuid, user_uuid, include_fields=[])
+    await storage_handler.delete_items(chunks)
 
-    chunks = storage_handler.get_file_chunks(file.uuid, user_uuid)
-    storage_handler.delete_items(chunks)
+    if redis_client is not None:
+        # cached answers may quote the deleted file
+        await redis_client.delete(answer_cache_key(user_uuid))
     return file
 
 
@@ -206,12 +223,22 @@ def delete_file(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uui
     tags=["file"],
     responses={404: {"model": APIError404, "description": "The file was not found"}},
 )
-def get_file_chunks(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> list[Chunk]:
+async def get_file_chunks(
+    file_uuid: UUID,
+    user_uuid: Annotated[UUID, Depends(get_user_uuid)],
+    storage_handler: StorageHandler,
+    fields: Annotated[Optional[list[str]], Query()] = None,
+    embedding_format: EmbeddingFormat = "float",
+) -> list[Chunk]:
     """Gets a list of chunks for a file in the database
 
     Args:
         file_uuid (UUID): The UUID of the file to delete
         user_uuid (UUID): The UUID of the user
+        fields (list, str): Optional Chunk fields to return, e.g. `?fields=embedding&fields=metadata`.
+            If not given, every field but the embedding is returned
+        embedding_format (str): "float" for each embedding as a list of floats, or "base64" for
+            the base64 encoded little-endian float32 bytes, which is about a quarter of the size
 
     Returns:
         Chunks (list, Chunk): The chunks belonging to the requested file
@@ -220,8 +247,8 @@ def get_file_chunks(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user
         404: If the file isn't found, or the creator and requester don't match
     """
     try:
-        file = storage_handler.read_item(file_uuid, model_type="File")
-    except NotFoundError:
+        file = await storage_handler.read_item(file_uuid, model_type="File")
+    except (NotFoundError, ItemNotFoundError):
         return file_not_found_response(file_uuid=file_uuid)
 
     if file.creator_user_uuid != user_uuid:
@@ -229,7 +256,15 @@ def get_file_chunks(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user
 
     log.info("getting chunks for file %s", file_uuid)
 
-    return storage_handler.get_file_chunks(file_uuid, user_uuid)
+    if fields is None:
+        chunks = await storage_handler.get_file_chunks(file_uuid, user_uuid, exclude_fields=["embedding"])
+    else:
+        chunks = await storage_handler.get_file_chunks(file_uuid, user_uuid, include_fields=fields)
+
+    # dumped directly, rather than FastAPI validating every chunk against the response model again
+    return ORJSONResponse(
+        content=[chunk.model_dump(mode="json", context={"embedding_format": embedding_format}) for chunk in chunks]
+    )
 
 
 @file_app.get(
@@ -237,29 +272,52 @@ def get_file_chunks(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user
     tags=["file"],
     responses={404: {"model": APIError404, "description": "The file was not found"}},
 )
-def get_file_status(file_uuid: UUID, user_uuid: Annotated[UUID, Depends(get_user_uuid)]) -> FileStatus:
+async def get_file_status(
+    file_uuid: UUID,
+    user_uuid: Annotated[UUID, Depends(get_user_uuid)],
+    storage_handler: StorageHandler,
+    include_chunk_statuses: bool = False,
+    offset: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+) -> FileStatus:
     """Get the status of a file
 
     Args:
         file_uuid (UUID): The UUID of the file to get the status of
         user_uuid (UUID): The UUID of the user
+        include_chunk_statuses (bool): Whether to include a page of chunk statuses
+        offset (int): The offset of the first chunk status to return
+        limit (int): The max number of chunk statuses to return
 
     Returns:
         File: The file with the updated status
 
     Raises:
         404: If the file isn't found, or the creator and requester don't match
+        422: If offset + limit is more than MAX_CHUNK_STATUSES_WINDOW
     """
+    if include_chunk_statuses and offset + limit > MAX_CHUNK_STATUSES_WINDOW:
+        raise HTTPException(
+            status_code=422,
+            detail=f"offset + limit should be no more than {MAX_CHUNK_STATUSES_WINDOW}",
+        )
+
     try:
-        file = storage_handler.read_item(file_uuid, model_type="File")
-    except NotFoundError:
+        file = await storage_handler.read_item(file_uuid, model_type="File")
+    except (NotFoundError, ItemNotFoundError):
         return file_not_found_response(file_uuid=file_uuid)
 
     if file.creator_user_uuid != user_uuid:
         return file_not_found_response(file_uuid=file_uuid)
 
     try:
-        status = storage_handler.get_file_status(file_uuid, user_uuid)
+        status = await storage_handler.get_file_status(
+            file_uuid,
+            user_uuid,
+            include_chunk_statuses=include_chunk_statuses,
+            chunk_statuses_offset=offset,
+            chunk_statuses_limit=limit,
+        )
     except ValueError:
         return file_not_found_response(file_uuid=file_uuid)
 
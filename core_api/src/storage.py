@@ -0,0 +1,20 @@
+from typing import Annotated
+
+from fastapi import Depends, Request
+
+from redbox.storage import AsyncElasticsearchStorageHandler, ThreadedStorageHandler
+
+AsyncStorageHandler = AsyncElasticsearchStorageHandler | ThreadedStorageHandler
+
+
+def get_storage_handler(request: Request) -> AsyncStorageHandler:
+    """The storage handler created by the app lifespan, see core_api.src.app.lifespan
+
+    It is passed in the lifespan state, rather than on app.state, as the routes are on mounted
+    sub-apps that don't share the main app's state. One handler is shared by the file and chat
+    routes, as the "memory" backend only exists in that one object.
+    """
+    return request.state.storage_handler
+
+
+StorageHandler = Annotated[AsyncStorageHandler, Depends(get_storage_handler)]
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from typing import Generator, TypeVar
 from uuid import UUID, uuid4
@@ -7,11 +8,12 @@ from botocore.exceptions import ClientError
 from elasticsearch import Elasticsearch
 from fastapi.testclient import TestClient
 from jose import jwt
+from redis.exceptions import WatchError
 
 from core_api.src.app import app as application
 from core_api.src.app import env
 from redbox.models import Chunk, File
-from redbox.storage import ElasticsearchStorageHandler
+from redbox.storage import ElasticsearchStorageHandler, InMemoryStorageHandler, ThreadedStorageHandler
 
 T = TypeVar("T")
 
@@ -40,7 +42,87 @@ def es_client() -> YieldFixture[Elasticsearch]:
 
 @pytest.fixture
 def app_client() -> YieldFixture[TestClient]:
-    yield TestClient(application)
+    # entered, so that the lifespan runs, and every request is served on the same event loop
+    with TestClient(application) as client:
+        yield client
+
+
+@pytest.fixture
+def local_storage_handler() -> YieldFixture[ThreadedStorageHandler]:
+    yield ThreadedStorageHandler(InMemoryStorageHandler(root_index="redbox-data"))
+
+
+class MockRedis:
+    """just enough of redis.asyncio.Redis's hash commands and WATCH/MULTI transactions"""
+
+    def __init__(self):
+        self.hashes: dict[str, dict[str, str]] = {}
+        # bumped on every write to a hash, so that transactions watching it fail
+        self.versions: dict[str, int] = {}
+
+    def _changed(self, name):
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+    async def hget(self, name, key):
+        value = self.hashes.get(name, {}).get(key)
+        # let other tasks run before the value is returned, as they would during a round trip to Redis
+        await asyncio.sleep(0)
+        return value
+
+    async def hset(self, name, key, value):
+        self.hashes.setdefault(name, {})[key] = value
+        self._changed(name)
+
+    async def hdel(self, name, *keys):
+        for key in keys:
+            self.hashes.get(name, {}).pop(key, None)
+        self._changed(name)
+
+    async def expire(self, name, seconds):
+        self._changed(name)
+
+    async def transaction(self, func, *watches):
+        while True:
+            pipe = MockPipeline(self, watches)
+            await func(pipe)
+            try:
+                return await pipe.execute()
+            except WatchError:
+                continue
+
+
+class MockPipeline:
+    """a transaction on MockRedis, that fails if a watched hash is written to before it executes"""
+
+    def __init__(self, redis, watches):
+        self.redis = redis
+        self.watched = {name: redis.versions.get(name, 0) for name in watches}
+        self.commands = []
+
+    async def hget(self, name, key):
+        return await self.redis.hget(name, key)
+
+    def multi(self):
+        pass
+
+    def hset(self, *args):
+        self.commands.append(("hset", args))
+
+    def hdel(self, *args):
+        self.commands.append(("hdel", args))
+
+    def expire(self, *args):
+        self.commands.append(("expire", args))
+
+    async def execute(self):
+        if any(self.redis.versions.get(name, 0) != version for name, version in self.watched.items()):
+            raise WatchError
+        return [await getattr(self.redis, command)(*args) for command, args in self.commands]
+
+
+@pytest.fixture
+def mock_redis() -> YieldFixture[MockRedis]:
+    yield MockRedis()
 
 
 @pytest.fixture
@@ -98,6 +180,21 @@ def chunked_file(elasticsearch_storage_handler, stored_file) -> YieldFixture[Fil
     yield stored_file
 
 
+@pytest.fixture
+def embedded_file(elasticsearch_storage_handler, stored_file) -> YieldFixture[File]:
+    for i in range(5):
+        chunk = Chunk(
+            text="hello",
+            index=i,
+            parent_file_uuid=stored_file.uuid,
+            creator_user_uuid=stored_file.creator_user_uuid,
+            embedding=[float(i)] * 3,
+        )
+        elasticsearch_storage_handler.write_item(chunk)
+    elasticsearch_storage_handler.refresh()
+    yield stored_file
+
+
 @pytest.fixture
 def file_pdf_path() -> YieldFixture[str]:
     path = os.path.join(
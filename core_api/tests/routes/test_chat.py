@@ -1,7 +1,17 @@
+import asyncio
+import json
+from uuid import uuid4
+
 import pytest
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessageChunk, HumanMessage, SystemMessage
 from langchain_core.prompt_values import ChatPromptValue
 
+from core_api.src.answer_cache import AnswerCache
+from core_api.src.routes.chat import embed_query, get_relevant_documents, query_embedding_cache
+from redbox.models import Chunk
+
 system_chat = {"text": "test", "role": "system"}
 user_chat = {"text": "test", "role": "user"}
 
@@ -22,20 +32,10 @@ def mock_chat_prompt(user_input):
     )
 
 
-class MockChain:
-    @staticmethod
-    def stream(user_input):
-        yield [{"input": "Test input", "text": "Test output"}]
-
-
-def mock_get_chain(llm, prompt):
-    return MockChain()
-
-
 @pytest.mark.parametrize("chat_history, status_code", test_history)
 def test_simple_chat(chat_history, status_code, app_client, monkeypatch, headers):
     monkeypatch.setattr("langchain_core.prompts.ChatPromptTemplate.from_messages", mock_chat_prompt)
-    monkeypatch.setattr("core_api.src.routes.chat.LLMChain", mock_get_chain)
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FakeListChatModel(responses=["Test output"]))
 
     response = app_client.post("/chat/vanilla", json={"message_history": chat_history}, headers=headers)
     assert response.status_code == status_code
@@ -66,3 +66,270 @@ def test_chat_errors(app_client, payload, error, headers):
     response = app_client.post("/chat/vanilla", json={"message_history": payload}, headers=headers)
     assert response.status_code == 422
     assert response.json() == error
+
+
+@pytest.fixture
+def relevant_documents(monkeypatch):
+    documents = [Document(page_content="hello", metadata={"parent_doc_uuid": str(uuid4())})]
+
+    async def mock_get_relevant_documents(question, user_uuid, storage_handler):
+        mock_get_relevant_documents.questions.append(question)
+        return documents
+
+    mock_get_relevant_documents.questions = []
+
+    monkeypatch.setattr("core_api.src.routes.chat.get_relevant_documents", mock_get_relevant_documents)
+    yield documents, mock_get_relevant_documents.questions
+
+
+def test_simple_chat_response(app_client, monkeypatch, headers):
+    """Given the app is running
+    When I POST a chat history to /chat/vanilla
+    I expect the LLM's answer back
+    """
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FakeListChatModel(responses=["Hi there"]))
+
+    message_history = [{"text": "test", "role": "system"}, {"text": "hello", "role": "user"}]
+    response = app_client.post("/chat/vanilla", json={"message_history": message_history}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["output_text"] == "Hi there"
+
+
+def test_rag_chat(app_client, monkeypatch, headers, relevant_documents):
+    """Given the app is running
+    When I POST a question to /chat/rag
+    I expect the LLM's answer back with the documents it was given as sources
+    """
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FakeListChatModel(responses=["Hi there"]))
+
+    message_history = [{"text": "test", "role": "system"}, {"text": "What is the answer?", "role": "user"}]
+    response = app_client.post("/chat/rag", json={"message_history": message_history}, headers=headers)
+    assert response.status_code == 200
+
+    chat_response = response.json()
+    assert chat_response["output_text"] == "Hi there"
+    assert chat_response["context_token_count"] > 0
+    assert chat_response["source_documents"][0]["file_uuid"] == relevant_documents[0][0].metadata["parent_doc_uuid"]
+
+
+@pytest.mark.parametrize(
+    "message_history, condense_question, standalone_question",
+    [
+        ([system_chat, {"text": "What is AI?", "role": "user"}], "follow_up", "What is AI?"),
+        ([system_chat, {"text": "What is AI?", "role": "user"}], "always", "standalone"),
+        (
+            [system_chat, user_chat, {"text": "test", "role": "ai"}, {"text": "What is AI?", "role": "user"}],
+            "follow_up",
+            "standalone",
+        ),
+        (
+            [system_chat, user_chat, {"text": "test", "role": "ai"}, {"text": "What is AI?", "role": "user"}],
+            "never",
+            "What is AI?",
+        ),
+    ],
+)
+def test_rag_chat_condense_question(
+    app_client, monkeypatch, headers, relevant_documents, message_history, condense_question, standalone_question
+):
+    """Given the app is running
+    When I POST a question to /chat/rag
+    I expect it to be rephrased as a standalone question only when it follows on from earlier
+    conversation, or as configured
+    """
+    monkeypatch.setattr("core_api.src.routes.chat.env.condense_question", condense_question)
+    monkeypatch.setattr("core_api.src.routes.chat.condense_question_llm", FakeListChatModel(responses=["standalone"]))
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FakeListChatModel(responses=["Hi there"]))
+
+    response = app_client.post("/chat/rag", json={"message_history": message_history}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["output_text"] == "Hi there"
+
+    _, questions = relevant_documents
+    assert questions == [standalone_question]
+
+
+def test_rag_chat_stream(app_client, monkeypatch, headers, relevant_documents):
+    """Given the app is running
+    When I POST a question to /chat/rag/stream
+    I expect a token event for each token of the answer followed by an end event with the sources
+    """
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FakeListChatModel(responses=["Hi there"]))
+
+    message_history = [{"text": "test", "role": "system"}, {"text": "What is the answer?", "role": "user"}]
+    response = app_client.post("/chat/rag/stream", json={"message_history": message_history}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [
+        dict(line.split(": ", 1) for line in event.splitlines()) for event in response.text.split("\n\n") if event
+    ]
+    tokens = [json.loads(event["data"])["text"] for event in events if event["event"] == "token"]
+    assert "".join(tokens) == "Hi there"
+
+    assert events[-1]["event"] == "end"
+    chat_response = json.loads(events[-1]["data"])
+    assert chat_response["output_text"] == "Hi there"
+    assert chat_response["source_documents"][0]["file_uuid"] == relevant_documents[0][0].metadata["parent_doc_uuid"]
+
+
+def test_rag_chat_stream_error(app_client, monkeypatch, headers, relevant_documents):
+    """Given the app is running
+    When the LLM fails part way through an answer to /chat/rag/stream
+    I expect the tokens sent so far followed by an error event, and no end event
+    """
+
+    class FailingChatModel(FakeListChatModel):
+        async def astream(self, *args, **kwargs):
+            yield AIMessageChunk(content="Hi")
+            raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FailingChatModel(responses=["Hi there"]))
+
+    message_history = [{"text": "test", "role": "system"}, {"text": "What is the answer?", "role": "user"}]
+    response = app_client.post("/chat/rag/stream", json={"message_history": message_history}, headers=headers)
+    assert response.status_code == 200
+
+    events = [
+        dict(line.split(": ", 1) for line in event.splitlines()) for event in response.text.split("\n\n") if event
+    ]
+    assert [event["event"] for event in events] == ["token", "error"]
+    assert json.loads(events[0]["data"]) == {"text": "Hi"}
+    assert json.loads(events[1]["data"]) == {"detail": "failed to generate an answer"}
+
+
+def test_query_embedding_cache(app_client, monkeypatch, headers):
+    """Given the app is running
+    When I ask the same question twice
+    I expect the question to be embedded once and the cache hit to be counted
+    """
+    calls = []
+
+    class MockEmbeddingModel:
+        @staticmethod
+        def embed_query(query):
+            calls.append(query)
+            return [0.1, 0.2]
+
+    monkeypatch.setattr("core_api.src.routes.chat.get_embedding_model", MockEmbeddingModel)
+    query_embedding_cache.clear()
+
+    assert asyncio.run(embed_query("What is AI?")) == [0.1, 0.2]
+    assert asyncio.run(embed_query("what is AI?")) == [0.1, 0.2]
+    assert calls == ["What is AI?"]
+
+    response = app_client.get("/chat/embedding/cache", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["hits"] == 1
+    assert response.json()["misses"] == 1
+
+
+def test_get_relevant_documents_client_rrf(monkeypatch, alice, local_storage_handler):
+    """Given retrieval_mode is client_rrf
+    When I retrieve documents for a question
+    I expect a BM25 and a kNN query to be sent in one msearch and their hits fused
+    """
+
+    class MockElasticsearch:
+        searches = None
+
+        async def msearch(self, searches):
+            self.searches = searches
+            bm25_hits = [{"_id": "a", "_source": {"text": "bm25 first"}}, {"_id": "b", "_source": {"text": "both"}}]
+            knn_hits = [{"_id": "b", "_source": {"text": "both"}}, {"_id": "c", "_source": {"text": "knn only"}}]
+            return {"responses": [{"hits": {"hits": bm25_hits}}, {"hits": {"hits": knn_hits}}]}
+
+    es = MockElasticsearch()
+    monkeypatch.setattr("core_api.src.routes.chat.es", es)
+    monkeypatch.setattr("core_api.src.routes.chat.env.retrieval_mode", "client_rrf")
+
+    docs = asyncio.run(get_relevant_documents("What is AI?", alice, local_storage_handler))
+
+    assert [doc.page_content for doc in docs] == ["both", "bm25 first", "knn only"]
+
+    _, bm25_query, _, knn_query = es.searches
+    user_filter = [{"term": {"creator_user_uuid.keyword": str(alice)}}]
+    assert bm25_query["query"]["bool"]["must"] == [{"match": {"text": "What is AI?"}}]
+    assert bm25_query["query"]["bool"]["filter"] == user_filter
+    assert knn_query["knn"]["filter"] == user_filter
+    assert knn_query["knn"]["query_vector"] == asyncio.run(embed_query("What is AI?"))
+
+
+def test_get_relevant_documents_local_storage(monkeypatch, alice, local_storage_handler):
+    """Given the storage backend is not Elasticsearch
+    When I retrieve documents for a question
+    I expect the user's chunks nearest to the question to be found by the storage handler
+    """
+    query_vector = asyncio.run(embed_query("What is AI?"))
+    file_uuid = uuid4()
+    chunks = [
+        Chunk(creator_user_uuid=alice, parent_file_uuid=file_uuid, index=i, text=text, embedding=embedding)
+        for i, (text, embedding) in enumerate(
+            [("nearest", query_vector), ("opposite", [-value for value in query_vector]), ("not embedded", None)]
+        )
+    ]
+    asyncio.run(local_storage_handler.write_items(chunks))
+    monkeypatch.setattr("core_api.src.routes.chat.env.storage_backend", "memory")
+
+    docs = asyncio.run(get_relevant_documents("What is AI?", alice, local_storage_handler))
+
+    assert [doc.page_content for doc in docs] == ["nearest", "opposite"]
+    assert docs[0].metadata["text_hash"] == chunks[0].text_hash
+    assert not asyncio.run(get_relevant_documents("What is AI?", uuid4(), local_storage_handler))
+
+
+def test_get_relevant_documents_mmr_rerank(app_client, monkeypatch, headers, alice, local_storage_handler):
+    """Given mmr_rerank is on
+    When I retrieve documents for a question
+    I expect mmr_fetch_k candidates to be fetched with their embeddings and mmr_k diverse ones kept
+    """
+    query_vector = asyncio.run(embed_query("What is AI?"))
+    orthogonal = [0.0] * len(query_vector)
+    orthogonal[0] = 1.0
+
+    class MockVectorStore:
+        kwargs = None
+
+        async def search(self, **kwargs):
+            self.kwargs = kwargs
+            return [
+                {"_id": "a", "_source": {"text": "best", "embedding": query_vector}},
+                {"_id": "b", "_source": {"text": "duplicate", "embedding": query_vector}},
+                {"_id": "c", "_source": {"text": "different", "embedding": orthogonal}},
+            ]
+
+    vector_store = MockVectorStore()
+    monkeypatch.setattr("core_api.src.routes.chat.vector_store", vector_store)
+    monkeypatch.setattr("core_api.src.routes.chat.env.mmr_rerank", True)
+    monkeypatch.setattr("core_api.src.routes.chat.env.mmr_fetch_k", 3)
+    monkeypatch.setattr("core_api.src.routes.chat.env.mmr_k", 2)
+    monkeypatch.setattr("core_api.src.routes.chat.env.mmr_lambda", 0.3)
+    reranks = app_client.get("/chat/rerank", headers=headers).json()["reranks"]
+
+    docs = asyncio.run(get_relevant_documents("What is AI?", alice, local_storage_handler))
+
+    assert vector_store.kwargs["k"] == 3
+    assert "embedding" in vector_store.kwargs["fields"]
+    assert [doc.page_content for doc in docs] == ["best", "different"]
+
+    rerank_info = app_client.get("/chat/rerank", headers=headers).json()
+    assert rerank_info["reranks"] == reranks + 1
+    assert rerank_info["last_seconds"] >= 0
+
+
+def test_rag_chat_answer_cache(app_client, monkeypatch, headers, relevant_documents, mock_redis):
+    """Given the answer cache is enabled
+    When I POST the same question to /chat/rag twice
+    I expect the second answer to come from the cache, without calling the LLM
+    """
+    monkeypatch.setattr(
+        "core_api.src.routes.chat.answer_cache", AnswerCache(redis=mock_redis, similarity_threshold=0.95)
+    )
+    monkeypatch.setattr("core_api.src.routes.chat.llm", FakeListChatModel(responses=["Hi there", "Something else"]))
+
+    message_history = [{"text": "test", "role": "system"}, {"text": "What is the answer?", "role": "user"}]
+    first_response = app_client.post("/chat/rag", json={"message_history": message_history}, headers=headers)
+    second_response = app_client.post("/chat/rag", json={"message_history": message_history}, headers=headers)
+
+    assert first_response.json()["output_text"] == "Hi there"
+    assert second_response.json() == first_response.json()
@@ -1,7 +1,9 @@
+import base64
 import json
 import os
 from http import HTTPStatus
 
+import numpy as np
 import pytest
 from elasticsearch import NotFoundError
 from faststream.redis import TestRedisBroker
@@ -121,6 +123,36 @@ def test_get_file_chunks(app_client, chunked_file, headers):
     assert len(response.json()) == 5
 
 
+def test_get_file_chunks_fields(app_client, chunked_file, headers):
+    """
+    Given a previously chunked file
+    When I GET it from /file/uuid/chunks?fields=embedding
+    I Expect to receive the chunks
+    """
+    response = app_client.get(f"/file/{chunked_file.uuid}/chunks", params={"fields": "embedding"}, headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.json()) == 5
+    assert all(chunk["text"] == "hello" for chunk in response.json())
+
+
+def test_get_file_chunks_base64_embedding(app_client, embedded_file, headers):
+    """
+    Given a previously chunked and embedded file
+    When I GET it from /file/uuid/chunks?fields=embedding&embedding_format=base64
+    I Expect to receive the chunks, each with its embedding as base64 encoded float32 bytes
+    """
+    response = app_client.get(
+        f"/file/{embedded_file.uuid}/chunks",
+        params={"fields": "embedding", "embedding_format": "base64"},
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.json()) == 5
+    for chunk in response.json():
+        embedding = np.frombuffer(base64.b64decode(chunk["embedding"]), dtype="<f4")
+        assert embedding.tolist() == [float(chunk["index"])] * 3
+
+
 def test_get_missing_file_chunks(app_client, headers):
     """
     Given a nonexistent file
@@ -139,3 +171,46 @@ def test_get_missing_file_status(app_client, headers):
     """
     response = app_client.get("/file/ffffffff-ffff-ffff-ffff-ffffffffffff/status", headers=headers)
     assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_get_file_status(app_client, chunked_file, headers):
+    """
+    Given a previously chunked file
+    When I GET it from /file/uuid/status
+    I Expect to receive the chunk counts, without the chunk statuses
+    """
+    response = app_client.get(f"/file/{chunked_file.uuid}/status", headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["chunk_count"] == 5
+    assert response.json()["embedded_chunk_count"] == 0
+    assert response.json()["chunk_statuses"] is None
+
+    response = app_client.get(
+        f"/file/{chunked_file.uuid}/status",
+        params={"include_chunk_statuses": True, "offset": 2, "limit": 2},
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.json()["chunk_statuses"]) == 2
+
+
+def test_get_file_status_chunk_statuses_window(app_client, chunked_file, headers):
+    """
+    Given a previously chunked file
+    When I GET chunk statuses from /file/uuid/status up to, and then past, the 10,000 result window
+    I Expect an empty page, and then a 422 error
+    """
+    response = app_client.get(
+        f"/file/{chunked_file.uuid}/status",
+        params={"include_chunk_statuses": True, "offset": 9_999, "limit": 1},
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["chunk_statuses"] == []
+
+    response = app_client.get(
+        f"/file/{chunked_file.uuid}/status",
+        params={"include_chunk_statuses": True, "offset": 9_999, "limit": 2},
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
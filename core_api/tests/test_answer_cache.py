@@ -0,0 +1,80 @@
+import asyncio
+import time
+from uuid import uuid4
+
+import pytest
+
+from core_api.src.answer_cache import AnswerCache, answer_cache_key
+from redbox.models import ChatResponse
+
+
+@pytest.fixture
+def answer_cache(mock_redis):
+    yield AnswerCache(redis=mock_redis, ttl_seconds=60, similarity_threshold=0.95)
+
+
+def test_answer_cache_hit(answer_cache, alice):
+    response = ChatResponse(output_text="Hi there")
+    asyncio.run(answer_cache.put(alice, [1.0, 0.0], ["hash-a", "hash-b"], response))
+
+    # a similar question, with the same chunks retrieved in a different order
+    assert asyncio.run(answer_cache.get(alice, [0.99, 0.05], ["hash-b", "hash-a"])) == response
+
+
+@pytest.mark.parametrize(
+    "question_embedding, text_hashes",
+    [
+        ([0.0, 1.0], ["hash-a", "hash-b"]),
+        ([1.0, 0.0], ["hash-a"]),
+        ([1.0, 0.0], ["hash-a", "hash-c"]),
+    ],
+)
+def test_answer_cache_miss(answer_cache, alice, question_embedding, text_hashes):
+    asyncio.run(answer_cache.put(alice, [1.0, 0.0], ["hash-a", "hash-b"], ChatResponse(output_text="Hi there")))
+
+    assert asyncio.run(answer_cache.get(alice, question_embedding, text_hashes)) is None
+
+
+def test_answer_cache_per_user(answer_cache, alice):
+    asyncio.run(answer_cache.put(alice, [1.0, 0.0], ["hash-a"], ChatResponse(output_text="Hi there")))
+
+    assert asyncio.run(answer_cache.get(uuid4(), [1.0, 0.0], ["hash-a"])) is None
+
+
+def test_answer_cache_expiry(answer_cache, alice, monkeypatch):
+    asyncio.run(answer_cache.put(alice, [1.0, 0.0], ["hash-a"], ChatResponse(output_text="Hi there")))
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert asyncio.run(answer_cache.get(alice, [1.0, 0.0], ["hash-a"])) is None
+    assert answer_cache.redis.hashes[answer_cache_key(alice)] == {}
+
+
+def test_answer_cache_max_entries_per_context(mock_redis, alice):
+    answer_cache = AnswerCache(redis=mock_redis, ttl_seconds=60, similarity_threshold=0.95, max_entries_per_context=2)
+    for i, question_embedding in enumerate([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]]):
+        asyncio.run(answer_cache.put(alice, question_embedding, ["hash-a"], ChatResponse(output_text=f"Answer {i}")))
+    asyncio.run(answer_cache.put(alice, [1.0, 0.0], ["hash-b"], ChatResponse(output_text="Other chunks")))
+
+    # the oldest answer for these chunks has been dropped, the answer for other chunks is kept
+    assert asyncio.run(answer_cache.get(alice, [1.0, 0.0], ["hash-a"])) is None
+    assert asyncio.run(answer_cache.get(alice, [0.0, 1.0], ["hash-a"])) == ChatResponse(output_text="Answer 1")
+    assert asyncio.run(answer_cache.get(alice, [-1.0, 0.0], ["hash-a"])) == ChatResponse(output_text="Answer 2")
+    assert asyncio.run(answer_cache.get(alice, [1.0, 0.0], ["hash-b"])) == ChatResponse(output_text="Other chunks")
+
+
+def test_answer_cache_concurrent_puts(answer_cache, alice):
+    async def put_concurrently():
+        await asyncio.gather(
+            *(
+                answer_cache.put(alice, question_embedding, ["hash-a"], ChatResponse(output_text=f"Answer {i}"))
+                for i, question_embedding in enumerate([[1.0, 0.0], [0.0, 1.0]])
+            )
+        )
+
+    asyncio.run(put_concurrently())
+
+    # both answers are kept, neither put overwrote the other's
+    assert asyncio.run(answer_cache.get(alice, [1.0, 0.0], ["hash-a"])) == ChatResponse(output_text="Answer 0")
+    assert asyncio.run(answer_cache.get(alice, [0.0, 1.0], ["hash-a"])) == ChatResponse(output_text="Answer 1")
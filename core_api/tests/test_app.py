@@ -1,3 +1,6 @@
+from core_api.src.routes import chat
+
+
 def test_get_health(app_client):
     """
     Given that the app is running
@@ -6,3 +9,34 @@ def test_get_health(app_client):
     """
     response = app_client.get("/health")
     assert response.status_code == 200
+
+
+def test_get_ready(app_client):
+    """
+    Given that the app is running without warm-up
+    When I call /ready
+    I Expect it to be ready without having loaded the embedding model
+    """
+    response = app_client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+
+
+def test_get_ready_warm_up(app_client, monkeypatch):
+    """
+    Given that the app is running with warm-up
+    When I call /ready before and after the embedding model has been warmed up
+    I Expect it to be loading and then ready
+    """
+    monkeypatch.setattr("core_api.src.app.env.warm_up", True)
+    chat.get_embedding_model_info.cache_clear()
+
+    response = app_client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "loading"
+
+    chat.warm_up()
+
+    response = app_client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
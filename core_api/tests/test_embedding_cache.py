@@ -0,0 +1,54 @@
+import time
+
+from core_api.src.embedding_cache import QueryEmbeddingCache
+
+
+def test_get_put():
+    cache = QueryEmbeddingCache(embedding_model="all-mpnet-base-v2")
+
+    assert cache.get("What is AI?") is None
+    cache.put("What is AI?", [0.1, 0.2])
+
+    # case and whitespace are normalised away
+    assert cache.get("  what is   AI? ") == [0.1, 0.2]
+    assert cache.get("What is ML?") is None
+
+    info = cache.info()
+    assert (info.hits, info.misses, info.size) == (1, 2, 1)
+
+
+def test_keyed_on_embedding_model():
+    cache = QueryEmbeddingCache(embedding_model="all-mpnet-base-v2")
+    cache.put("What is AI?", [0.1, 0.2])
+
+    other_cache = QueryEmbeddingCache(embedding_model="all-MiniLM-L6-v2")
+    assert cache.key("What is AI?") != other_cache.key("What is AI?")
+
+
+def test_least_recently_used_evicted():
+    cache = QueryEmbeddingCache(embedding_model="all-mpnet-base-v2", max_size=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    assert cache.get("a") == [1.0]
+
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert cache.get("c") == [3.0]
+    assert cache.info().size == 2
+
+
+def test_expired_entries_missed(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+
+    cache = QueryEmbeddingCache(embedding_model="all-mpnet-base-v2", ttl_seconds=60)
+    cache.put("a", [1.0])
+
+    now += 59
+    assert cache.get("a") == [1.0]
+
+    now += 1
+    assert cache.get("a") is None
+    assert cache.info().size == 0
@@ -3,6 +3,7 @@ from types import SimpleNamespace
 from uuid import UUID
 
 import boto3
+import orjson
 import requests
 from botocore.exceptions import ClientError
 from django.conf import settings
@@ -39,6 +40,19 @@ def s3_client():
     return client
 
 
+def to_namespace(data):
+    """as json(object_hook=SimpleNamespace), for the dicts and lists given by orjson"""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{key: to_namespace(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [to_namespace(value) for value in data]
+    return data
+
+
+def parse_response(response: requests.Response) -> SimpleNamespace:
+    return to_namespace(orjson.loads(response.content))
+
+
 class CoreApiClient:
     def __init__(self, host: str, port: int):
         self.host = host
@@ -53,7 +67,7 @@ class CoreApiClient:
             self.url / "file", json={"key": name}, headers={"Authorization": user.get_bearer_token()}, timeout=30
         )
         response.raise_for_status()
-        return response.json(object_hook=lambda d: SimpleNamespace(**d))
+        return parse_response(response)
 
     def rag_chat(self, message_history: list[dict[str, str]], user: User) -> SimpleNamespace:
         response = requests.post(
@@ -63,7 +77,7 @@ class CoreApiClient:
             timeout=60,
         )
         response.raise_for_status()
-        response_data = response.json(object_hook=lambda d: SimpleNamespace(**d))
+        response_data = parse_response(response)
         logger.debug("response_data: %s", response_data)
 
         return response_data
@@ -72,12 +86,12 @@ class CoreApiClient:
         url = self.url / "file" / str(file_id) / "status"
         response = requests.get(url, headers={"Authorization": user.get_bearer_token()}, timeout=60)
         response.raise_for_status()
-        response_data = response.json(object_hook=lambda d: SimpleNamespace(**d))
+        response_data = parse_response(response)
         return response_data
 
     def delete_file(self, file_id: UUID, user: User) -> SimpleNamespace:
         url = self.url / "file" / str(file_id)
         response = requests.delete(url, headers={"Authorization": user.get_bearer_token()}, timeout=60)
         response.raise_for_status()
-        response_data = response.json(object_hook=lambda d: SimpleNamespace(**d))
+        response_data = parse_response(response)
         return response_data
@@ -0,0 +1,13 @@
+from types import SimpleNamespace
+
+from redbox_app.redbox_core.client import to_namespace
+
+
+def test_to_namespace():
+    data = {"output_text": "hello", "source_documents": [{"file_uuid": "abc", "page_numbers": [1, 2]}]}
+
+    actual = to_namespace(data)
+
+    assert actual == SimpleNamespace(
+        output_text="hello", source_documents=[SimpleNamespace(file_uuid="abc", page_numbers=[1, 2])]
+    )
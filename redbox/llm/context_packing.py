@@ -0,0 +1,70 @@
+import hashlib
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from redbox.models.file import encoding
+
+
+def document_text_hash(document: Document) -> str:
+    """The Chunk.text_hash stored with the document, or the same hash of its text"""
+    if text_hash := document.metadata.get("text_hash"):
+        return text_hash
+    text = document.page_content.encode(encoding="UTF-8", errors="strict")
+    return hashlib.md5(text, usedforsecurity=False).hexdigest()
+
+
+def document_token_count(document: Document) -> int:
+    """The Chunk.token_count stored with the document, or the count of its text's tokens"""
+    token_count: Optional[int] = document.metadata.get("token_count")
+    if token_count is None:
+        token_count = len(encoding.encode(document.page_content))
+    return token_count
+
+
+def pack_documents(
+    documents: list[Document], token_budget: int, min_truncated_tokens: int = 50
+) -> tuple[list[Document], int]:
+    """Fill a token budget with the retrieved documents, most relevant first
+
+    Documents with the same text as one already packed are skipped. A document that
+    does not fit in what is left of the budget is truncated to fit, if at least
+    min_truncated_tokens of it would be kept, otherwise it and every document ranked
+    below it are dropped.
+
+    Args:
+        documents (list[Document]): documents in descending order of relevance
+        token_budget (int): max number of cl100k_base tokens of document text to keep
+        min_truncated_tokens (int, optional): the fewest tokens a truncated document may keep.
+            Defaults to 50.
+
+    Returns:
+        tuple[list[Document], int]: the documents that fit and the number of tokens they use
+    """
+    packed: list[Document] = []
+    seen_text_hashes: set[str] = set()
+    tokens_used = 0
+
+    for document in documents:
+        text_hash = document_text_hash(document)
+        if text_hash in seen_text_hashes:
+            continue
+        seen_text_hashes.add(text_hash)
+
+        token_count = document_token_count(document)
+        remaining = token_budget - tokens_used
+
+        if token_count > remaining:
+            if remaining < min_truncated_tokens:
+                break
+            page_content = encoding.decode(encoding.encode(document.page_content)[:remaining])
+            token_count = remaining
+            document = Document(
+                page_content=page_content,
+                metadata=document.metadata | {"token_count": token_count, "truncated": True},
+            )
+
+        packed.append(document)
+        tokens_used += token_count
+
+    return packed, tokens_used
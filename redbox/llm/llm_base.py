@@ -1,5 +1,8 @@
+import json
+from collections import OrderedDict
 from datetime import date
-from typing import Any, Optional
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional, TypeVar
 
 from langchain.chains import MapReduceDocumentsChain, ReduceDocumentsChain
 from langchain.chains.combine_documents.base import BaseCombineDocumentsChain
@@ -27,6 +30,126 @@ from redbox.llm.spotlight.spotlight import (
 from redbox.models.file import File
 from redbox.models.spotlight import Spotlight, SpotlightTask
 
+T = TypeVar("T")
+
+
+class ChainCache:
+    """A thread-safe, least recently used, cache of chains and retrievers, each built once
+    for a given configuration and reused across requests.
+
+    Chains hold no per-call state, callbacks are passed when they are run, so one instance
+    can serve concurrent requests. Chains are keyed on the configuration of the LLM they
+    wrap, see llm_cache_key, so LLMs built per request share them. Retrievers are keyed on
+    the id() of their vector store: the cached retriever holds a reference to it, so the id
+    cannot be reused while the entry exists, and at most maxsize entries are kept.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, build: Callable[[], T]) -> T:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                item = self._items[key] = build()
+                if len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+            else:
+                self._items.move_to_end(key)
+        return item
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+chain_cache = ChainCache()
+
+
+# Configuration fields that decide what an LLM returns. Credentials and clients are left out,
+# as is per-instance state, so chains are shared by LLMs that differ only in those
+LLM_CACHE_KEY_FIELDS = (
+    "model",
+    "model_name",
+    "temperature",
+    "max_tokens",
+    "top_p",
+    "top_k",
+    "n",
+    "streaming",
+    "api_base",
+    "openai_api_base",
+    "custom_llm_provider",
+    "request_timeout",
+    "max_retries",
+    "model_kwargs",
+    "responses",
+    "sleep",
+)
+
+
+def llm_cache_key(llm) -> str:
+    """The LLM's class and the LLM_CACHE_KEY_FIELDS it has, so that LLMs with the same configuration share chains"""
+    config = {name: getattr(llm, name) for name in LLM_CACHE_KEY_FIELDS if name in llm.__fields__}
+    return json.dumps([type(llm).__qualname__, config], sort_keys=True, default=str)
+
+
+def get_condense_question_chain(llm) -> LLMChain:
+    return chain_cache.get(
+        ("condense_question", llm_cache_key(llm)),
+        lambda: LLMChain(llm=llm, prompt=CONDENSE_QUESTION_PROMPT),
+    )
+
+
+def get_docs_with_sources_chain(llm) -> BaseCombineDocumentsChain:
+    return chain_cache.get(
+        ("docs_with_sources", llm_cache_key(llm)),
+        lambda: load_qa_with_sources_chain(
+            llm,
+            chain_type="stuff",
+            prompt=WITH_SOURCES_PROMPT,
+            document_prompt=STUFF_DOCUMENT_PROMPT,
+            verbose=True,
+        ),
+    )
+
+
+def get_retriever(vector_store):
+    return chain_cache.get(("retriever", id(vector_store)), vector_store.as_retriever)
+
+
+def build_spotlight_chains(
+    llm, task: SpotlightTask, token_max: int
+) -> tuple[StuffDocumentsChain, MapReduceDocumentsChain]:
+    map_chain = LLMChain(llm=llm, prompt=task.prompt_template)  # type: ignore
+    regular_chain = StuffDocumentsChain(llm_chain=map_chain, document_variable_name="text")
+
+    reduce_chain = LLMChain(llm=llm, prompt=SPOTLIGHT_COMBINATION_TASK_PROMPT)
+    combine_documents_chain = StuffDocumentsChain(llm_chain=reduce_chain, document_variable_name="text")
+    reduce_documents_chain = ReduceDocumentsChain(
+        combine_documents_chain=combine_documents_chain,
+        collapse_documents_chain=combine_documents_chain,
+        token_max=token_max,
+    )
+    map_reduce_chain = MapReduceDocumentsChain(
+        llm_chain=map_chain,
+        reduce_documents_chain=reduce_documents_chain,
+        document_variable_name="text",
+        return_intermediate_steps=False,
+    )
+    return regular_chain, map_reduce_chain
+
+
+def get_spotlight_chains(
+    llm, task: SpotlightTask, token_max: int
+) -> tuple[StuffDocumentsChain, MapReduceDocumentsChain]:
+    return chain_cache.get(
+        ("spotlight", llm_cache_key(llm), task.id, token_max),
+        lambda: build_spotlight_chains(llm, task, token_max),
+    )
+
 
 class LLMHandler(object):
     """A class to handle RedBox data suffused interactions with a given LLM"""
@@ -86,15 +209,8 @@ class LLMHandler(object):
             BaseCombineDocumentsChain: docs-with-sources-chain
         """
 
-        docs_with_sources_chain = load_qa_with_sources_chain(
-            self.llm,
-            chain_type="stuff",
-            prompt=WITH_SOURCES_PROMPT,
-            document_prompt=STUFF_DOCUMENT_PROMPT,
-            verbose=True,
-        )
-
-        condense_question_chain = LLMChain(llm=self.llm, prompt=CONDENSE_QUESTION_PROMPT)
+        docs_with_sources_chain = get_docs_with_sources_chain(self.llm)
+        condense_question_chain = get_condense_question_chain(self.llm)
 
         # split chain manually, so that the standalone question doesn't leak into chat
         # should we display some waiting message instead?
@@ -107,7 +223,7 @@ class LLMHandler(object):
             }
         )["text"]
 
-        docs = self.vector_store.as_retriever().get_relevant_documents(
+        docs = get_retriever(self.vector_store).get_relevant_documents(
             standalone_question,
         )
 
@@ -144,22 +260,7 @@ class LLMHandler(object):
         map_reduce: bool = False,
         token_max: int = 100_000,
     ) -> tuple[Any, StuffDocumentsChain | MapReduceDocumentsChain]:
-        map_chain = LLMChain(llm=self.llm, prompt=task.prompt_template)  # type: ignore
-        regular_chain = StuffDocumentsChain(llm_chain=map_chain, document_variable_name="text")
-
-        reduce_chain = LLMChain(llm=self.llm, prompt=SPOTLIGHT_COMBINATION_TASK_PROMPT)
-        combine_documents_chain = StuffDocumentsChain(llm_chain=reduce_chain, document_variable_name="text")
-        reduce_documents_chain = ReduceDocumentsChain(
-            combine_documents_chain=combine_documents_chain,
-            collapse_documents_chain=combine_documents_chain,
-            token_max=token_max,
-        )
-        map_reduce_chain = MapReduceDocumentsChain(
-            llm_chain=map_chain,
-            reduce_documents_chain=reduce_documents_chain,
-            document_variable_name="text",
-            return_intermediate_steps=False,
-        )
+        regular_chain, map_reduce_chain = get_spotlight_chains(self.llm, task, token_max)
 
         if map_reduce:
             result = map_reduce_chain.run(
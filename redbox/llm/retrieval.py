@@ -0,0 +1,80 @@
+from typing import Any, Optional
+
+import numpy as np
+
+
+def reciprocal_rank_fusion(
+    result_lists: list[list[dict[str, Any]]], rank_constant: int = 60, size: Optional[int] = None
+) -> list[dict[str, Any]]:
+    """Fuse ranked lists of Elasticsearch hits with reciprocal rank fusion
+
+    Each hit scores the sum of 1 / (rank_constant + rank) over the lists it appears in,
+    with ranks starting at 1, the same as Elasticsearch's own rrf rank.
+    See https://www.elastic.co/guide/en/elasticsearch/reference/current/rrf.html
+
+    Args:
+        result_lists (list[list[dict]]): hits from each query, best first
+        rank_constant (int, optional): how much lower ranked hits count. Defaults to 60.
+        size (int, optional): number of hits to return. Defaults to all of them.
+
+    Returns:
+        list[dict]: the distinct hits, by _id, best first, with their fused _score
+    """
+    scores: dict[str, float] = {}
+    hits: dict[str, dict[str, Any]] = {}
+
+    for result_list in result_lists:
+        for rank, hit in enumerate(result_list, start=1):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (rank_constant + rank)
+            hits.setdefault(hit["_id"], hit)
+
+    ranked_ids = sorted(scores, key=scores.__getitem__, reverse=True)[:size]
+    return [hits[_id] | {"_score": scores[_id]} for _id in ranked_ids]
+
+
+def maximal_marginal_relevance(
+    query_embedding: list[float] | np.ndarray,
+    embeddings: list[list[float]] | np.ndarray,
+    k: int = 4,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """Select k of the candidate embeddings that are relevant to the query but not to each other
+
+    Each step picks the candidate maximising
+    lambda_mult * sim(query, candidate) - (1 - lambda_mult) * max sim(candidate, selected)
+    with cosine similarity. The max similarity to the selected candidates is updated with
+    one matrix-vector product per step, so selection is O(k * n * d) for n candidates.
+
+    Args:
+        query_embedding (list[float] | np.ndarray): the embedding of the query, left unchanged
+        embeddings (list[list[float]] | np.ndarray): the embeddings of the candidates, best first, left unchanged
+        k (int, optional): number of candidates to select. Defaults to 4.
+        lambda_mult (float, optional): 1 for relevance alone, 0 for diversity alone. Defaults to 0.5.
+
+    Returns:
+        list[int]: indices of the selected candidates, in the order they were selected
+    """
+    if len(embeddings) == 0 or k <= 0:
+        return []
+
+    # not in place, asarray returns the caller's own array when it is already float32
+    candidates = np.asarray(embeddings, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    relevance = candidates @ query
+    max_redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+
+    selected = [int(np.argmax(relevance))]
+    available[selected[0]] = False
+
+    while len(selected) < min(k, len(candidates)):
+        np.maximum(max_redundancy, candidates @ candidates[selected[-1]], out=max_redundancy)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_redundancy
+        scores[~available] = -np.inf
+        selected.append(int(np.argmax(scores)))
+        available[selected[-1]] = False
+
+    return selected
@@ -18,13 +18,14 @@ class SentenceTransformerDB(SentenceTransformer):
         self.embedding_model_name = embedding_model_name
 
     def embed_sentences(self, sentences: list[str]) -> EmbeddingResponse:
-        embeddings = self.encode(sentences)
+        # float32 rows of this array become the embeddings without being copied
+        embeddings = self.encode(sentences, convert_to_numpy=True)
 
         reformatted_embeddings = [
             Embedding(
                 object="embedding",
                 index=i,
-                embedding=list(embedding),
+                embedding=embedding,
             )
             for i, embedding in enumerate(embeddings)
         ]
@@ -1,5 +1,7 @@
-from redbox.models.chat import ChatMessage, ChatRequest, ChatResponse
+from redbox.models.chat import ChatMessage, ChatRequest, ChatResponse, RerankInfo
 from redbox.models.embedding import (
+    EmbeddingCacheInfo,
+    EmbeddingFormat,
     EmbeddingModelInfo,
     EmbeddingResponse,
     EmbedQueueItem,
@@ -33,6 +35,8 @@ __all__ = [
     "ChatRequest",
     "Chunk",
     "ChunkStatus",
+    "EmbeddingCacheInfo",
+    "EmbeddingFormat",
     "EmbeddingModelInfo",
     "File",
     "FileStatus",
@@ -41,6 +45,7 @@ __all__ = [
     "SpotlightTask",
     "SpotlightTaskComplete",
     "Settings",
+    "RerankInfo",
     "EmbeddingResponse",
     "EmbedQueueItem",
     "StatusResponse",
@@ -52,3 +52,14 @@ class ChatResponse(BaseModel):
         description="response text",
         examples=["The current Prime Minister of the UK is The Rt Hon. Rishi Sunak MP."],
     )
+    context_token_count: Optional[int] = Field(
+        description="number of tokens of the source documents given to the LLM", default=None
+    )
+
+
+class RerankInfo(BaseModel):
+    """Timing of the maximal marginal relevance re-ranking of retrieved chunks"""
+
+    reranks: int = Field(description="number of times retrieved chunks have been re-ranked", default=0)
+    total_seconds: float = Field(description="total time spent re-ranking", default=0.0)
+    last_seconds: Optional[float] = Field(description="time spent on the most recent re-rank", default=None)
@@ -1,7 +1,60 @@
-from typing import Literal
+import base64
+import builtins
+from typing import Annotated, Any, Literal, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+import numpy as np
+from pydantic import BaseModel, Field, PlainSerializer, PlainValidator, SerializationInfo, WithJsonSchema
+
+EmbeddingFormat = Literal["float", "base64"]
+
+
+def to_vector(value: Any) -> np.ndarray:
+    """Read an embedding into a float32 array
+
+    A float32 array, such as a row of `SentenceTransformer.encode` output, is used as is rather than copied.
+    A string is taken to be the base64 encoded little-endian float32 bytes, as given by `embedding_format="base64"`.
+    """
+    if isinstance(value, str):
+        # copied, as frombuffer gives a read-only view of the decoded bytes
+        return np.frombuffer(base64.b64decode(value), dtype="<f4").copy()
+    vector = np.asarray(value, dtype=np.float32)
+    if vector.ndim != 1:
+        raise ValueError(f"an embedding must be one dimensional, not {vector.ndim} dimensional")
+    return vector
+
+
+def serialise_vector(vector: np.ndarray, info: SerializationInfo) -> list[float] | str:
+    """Write an embedding as a list of floats, or as base64 when the serialisation context has
+    `{"embedding_format": "base64"}`
+
+    Elasticsearch only takes the list of floats, so that is the default.
+    """
+    vector = to_vector(vector)
+    if (info.context or {}).get("embedding_format") == "base64":
+        return base64.b64encode(vector.astype("<f4", copy=False).tobytes()).decode("ascii")
+    return vector.tolist()
+
+
+def vectors_equal(left: Optional[np.ndarray], right: Optional[np.ndarray]) -> bool:
+    if left is None or right is None:
+        return left is right
+    return np.array_equal(left, right)
+
+
+Vector = Annotated[
+    np.ndarray,
+    PlainValidator(to_vector),
+    PlainSerializer(serialise_vector),
+    WithJsonSchema(
+        {
+            "anyOf": [
+                {"type": "array", "items": {"type": "number"}},
+                {"type": "string", "contentEncoding": "base64"},
+            ]
+        }
+    ),
+]
 
 
 class EmbeddingModelInfo(BaseModel):
@@ -11,12 +64,30 @@ class EmbeddingModelInfo(BaseModel):
     vector_size: int
 
 
+class EmbeddingCacheInfo(BaseModel):
+    """Usage of the cache of query embeddings"""
+
+    embedding_model: str
+    hits: int
+    misses: int
+    size: int = Field(description="number of query embeddings currently cached")
+    max_size: int
+    ttl_seconds: float
+
+
 class Embedding(BaseModel):
     """Embedding of a piece of text"""
 
     object: Literal["embedding"]
     index: int
-    embedding: list[float]
+    embedding: Vector
+
+    def __eq__(self, other: builtins.object) -> bool:
+        if not isinstance(other, Embedding):
+            return NotImplemented
+        return (
+            self.object == other.object and self.index == other.index and vectors_equal(self.embedding, other.embedding)
+        )
 
 
 class EmbeddingResponse(BaseModel):
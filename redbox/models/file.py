@@ -2,13 +2,15 @@ from __future__ import annotations
 
 import hashlib
 from enum import Enum
-from typing import Optional
+from functools import cached_property
+from typing import Any, Optional
 from uuid import UUID
 
 import tiktoken
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field, ValidatorFunctionWrapHandler, computed_field, model_validator
 
 from redbox.models.base import PersistableModel
+from redbox.models.embedding import Vector, vectors_equal
 
 encoding = tiktoken.get_encoding("cl100k_base")
 
@@ -117,16 +119,55 @@ class Chunk(PersistableModel):
     index: int = Field(description="relative position of this chunk in the original file")
     text: str = Field(description="chunk of the original text")
     metadata: Optional[Metadata] = Field(description="subset of the unstructured Element.Metadata object", default=None)
-    embedding: Optional[list[float]] = Field(description="the vector representation of the text", default=None)
+    embedding: Optional[Vector] = Field(description="the float32 vector representation of the text", default=None)
 
-    @computed_field
+    @computed_field  # type: ignore[misc]
+    @cached_property
     def text_hash(self) -> str:
         return hashlib.md5(self.text.encode(encoding="UTF-8", errors="strict"), usedforsecurity=False).hexdigest()
 
-    @computed_field
+    @computed_field  # type: ignore[misc]
+    @cached_property
     def token_count(self) -> int:
         return len(encoding.encode(self.text))
 
+    @model_validator(mode="wrap")
+    @classmethod
+    def trust_stored_text_hash_and_token_count(cls, data: Any, handler: ValidatorFunctionWrapHandler) -> Chunk:
+        """A chunk loaded from storage comes with the text_hash and token_count that were
+        computed when it was saved, use them rather than computing them again"""
+        chunk = handler(data)
+        if isinstance(data, dict):
+            for name in ("text_hash", "token_count"):
+                if data.get(name) is not None:
+                    chunk.__dict__[name] = data[name]
+        return chunk
+
+    def forget_text_hash_and_token_count(self) -> None:
+        self.__dict__.pop("text_hash", None)
+        self.__dict__.pop("token_count", None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name == "text":
+            self.forget_text_hash_and_token_count()
+
+    def __eq__(self, other: object) -> bool:
+        """as BaseModel.__eq__, but comparing embeddings as arrays"""
+        if not isinstance(other, Chunk):
+            return NotImplemented
+        return (
+            type(self) is type(other)
+            and all(self.__dict__[name] == other.__dict__[name] for name in self.model_fields if name != "embedding")
+            and vectors_equal(self.embedding, other.embedding)
+        )
+
+    def model_copy(self, *, update: Optional[dict[str, Any]] = None, deep: bool = False) -> Chunk:
+        copied = super().model_copy(update=update, deep=deep)
+        if update and "text" in update:
+            copied.forget_text_hash_and_token_count()
+        return copied
+
 
 class ChunkStatus(BaseModel):
     """Status of a chunk of a file."""
@@ -140,4 +181,8 @@ class FileStatus(BaseModel):
 
     file_uuid: UUID
     processing_status: ProcessingStatusEnum
-    chunk_statuses: Optional[list[ChunkStatus]]
+    chunk_count: int = Field(description="number of chunks the file has been split into", default=0)
+    embedded_chunk_count: int = Field(description="number of chunks that have been embedded", default=0)
+    chunk_statuses: Optional[list[ChunkStatus]] = Field(
+        description="status of a page of the chunks, only populated when requested", default=None
+    )
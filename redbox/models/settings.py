@@ -1,8 +1,9 @@
+import os
 from typing import Literal, Optional
 
 import boto3
-from elasticsearch import Elasticsearch
-from pydantic import BaseModel
+from elasticsearch import AsyncElasticsearch, Elasticsearch, OrjsonSerializer
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -33,8 +34,23 @@ class Settings(BaseSettings):
     openai_api_key: Optional[str] = None
 
     partition_strategy: Literal["auto", "fast", "ocr_only", "hi_res"] = "fast"
+    # the worker takes files from the ingest queue in batches of up to this many, partitioned in
+    # parallel, and only takes the next batch once the slowest file in the batch is done
+    ingest_max_workers: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    # "queue" puts every chunk on the embed queue, "clustering" merges similar chunks
+    # on ingest and reuses the embeddings computed for that, skipping the embed queue
+    ingest_embedding_mode: Literal["queue", "clustering"] = "queue"
+    # in "clustering" mode every ingest process loads its own embedding model, so fewer are run,
+    # and the cores are shared between their torch threads
+    ingest_clustering_max_workers: int = Field(default_factory=lambda: max(1, (os.cpu_count() or 1) // 4))
 
     elastic: ElasticCloudSettings | ElasticLocalSettings = ElasticLocalSettings()
+    # where the worker and core-api store files and chunks, "sqlite" keeps them in a single
+    # file at sqlite_path that both can share on one machine, "memory" only lasts as long as
+    # the process, for tests and benchmarks. Both search chunks by brute force kNN alone, so
+    # retrieval_mode only applies to "elasticsearch"
+    storage_backend: Literal["elasticsearch", "sqlite", "memory"] = "elasticsearch"
+    sqlite_path: str = "redbox.sqlite3"
 
     kibana_system_password: str = "redboxpass"
     metricbeat_internal_password: str = "redboxpass"
@@ -51,10 +67,55 @@ class Settings(BaseSettings):
     aws_region: str = "eu-west-2"
     bucket_name: str = "redbox-storage-dev"
     embedding_model: str = "all-mpnet-base-v2"
+    # load the core-api embedding model and run it once at startup, rather than on the first chat
+    warm_up: bool = False
+    query_embedding_cache_size: int = 1024
+    query_embedding_cache_ttl_seconds: float = 3600.0
 
     embed_queue_name: str = "redbox-embedder-queue"
     ingest_queue_name: str = "redbox-ingester-queue"
 
+    # the embed worker takes whatever is on the queue, up to embed_queue_batch_size chunks, as one
+    # batch without waiting for it to fill, and polls again every embed_queue_poll_interval seconds
+    # while the queue is empty
+    embed_queue_batch_size: int = 32
+    embed_queue_poll_interval: float = 0.1
+
+    # "follow_up" only rephrases the question as a standalone one when there is earlier
+    # conversation for it to refer to, "always" does so on every turn and "never" does not
+    condense_question: Literal["always", "follow_up", "never"] = "follow_up"
+    # a smaller/faster LLM to rephrase the question with, defaults to the chat LLM
+    condense_question_model: Optional[str] = None
+
+    # "vector_store" searches with kNN, or Elasticsearch's own hybrid search on platinum and
+    # enterprise subscriptions, "client_rrf" sends a BM25 and a kNN query in one msearch and
+    # fuses their results here with reciprocal rank fusion, which works on any subscription
+    retrieval_mode: Literal["vector_store", "client_rrf"] = "vector_store"
+    rrf_rank_constant: int = 60
+    rrf_window_size: int = 20
+
+    # re-rank mmr_fetch_k retrieved chunks with maximal marginal relevance, keeping mmr_k of
+    # them, to avoid giving the LLM near-duplicate chunks, e.g. from adjacent pages
+    mmr_rerank: bool = False
+    mmr_fetch_k: int = 20
+    mmr_k: int = 4
+    mmr_lambda: float = 0.5
+
+    # max number of tokens of retrieved chunks given to the LLM to answer a question with
+    rag_context_token_budget: int = 8_000
+
+    # opt-in cache of /chat/rag answers in Redis, reused for a question from the same user
+    # within answer_cache_similarity_threshold cosine similarity of an earlier one, when the
+    # same chunks are retrieved for it, dropped when the user deletes a file. At most
+    # answer_cache_max_entries_per_context answers are kept for each set of chunks
+    answer_cache_enabled: bool = False
+    answer_cache_ttl_seconds: int = 86_400
+    answer_cache_similarity_threshold: float = 0.95
+    answer_cache_max_entries_per_context: int = 8
+
+    # max number of chat requests each core-api process serves at once, the rest wait their turn
+    chat_max_concurrency: int = 40
+
     redis_host: str = "redis"
     redis_port: int = 6379
 
@@ -83,22 +144,28 @@ class Settings(BaseSettings):
 
     model_config = SettingsConfigDict(env_file=".env", env_nested_delimiter="__", extra="allow")
 
-    def elasticsearch_client(self) -> Elasticsearch:
+    def elasticsearch_client_kwargs(self) -> dict:
+        # orjson, rather than the standard library, for request and response bodies
         if isinstance(self.elastic, ElasticLocalSettings):
-            es = Elasticsearch(
-                hosts=[
+            return {
+                "hosts": [
                     {
                         "host": self.elastic.host,
                         "port": self.elastic.port,
                         "scheme": self.elastic.scheme,
                     }
                 ],
-                basic_auth=(self.elastic.user, self.elastic.password),
-            )
-            return es
+                "basic_auth": (self.elastic.user, self.elastic.password),
+                "serializer": OrjsonSerializer(),
+            }
+
+        return {"cloud_id": self.elastic.cloud_id, "api_key": self.elastic.api_key, "serializer": OrjsonSerializer()}
+
+    def elasticsearch_client(self) -> Elasticsearch:
+        return Elasticsearch(**self.elasticsearch_client_kwargs())
 
-        es = Elasticsearch(cloud_id=self.elastic.cloud_id, api_key=self.elastic.api_key)
-        return es
+    def async_elasticsearch_client(self) -> AsyncElasticsearch:
+        return AsyncElasticsearch(**self.elasticsearch_client_kwargs())
 
     def s3_client(self):
         if self.object_store == "minio":
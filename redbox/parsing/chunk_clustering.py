@@ -1,5 +1,8 @@
+import heapq
+import math
 from functools import reduce
 from itertools import compress
+from typing import Literal
 
 import numpy as np
 import scipy
@@ -15,6 +18,9 @@ def cluster_chunks(
     desired_chunk_size: int = 300,
     dist_weight_split: float = 0.2,
     dist_use_log: bool = True,
+    strategy: Literal["adjacent", "hierarchical"] = "adjacent",
+    embedding_batch_size: int = 32,
+    embed_chunks: bool = False,
 ) -> list[Chunk]:
     """Merge together adjacent chunks based on their semantic similarity (distance after sentence embedding)
     and length(token count)
@@ -28,6 +34,13 @@ def cluster_chunks(
                 of the semantic similarity vs the token counts. Defaults to .2.
             dist_use_log (bool): When calculating the combined distance metric should the input values
                 be scaled by log. Defaults to True.
+            strategy (str): "adjacent" merges neighbouring chunks greedily in O(n log n),
+                "hierarchical" uses scipy's complete linkage, which is O(n^2) in memory.
+                Both give the same clusters, up to the order in which equal distances are merged.
+                Defaults to "adjacent".
+            embedding_batch_size (int): Number of chunks the embedding model encodes at once. Defaults to 32.
+            embed_chunks (bool): Whether to also set the embedding of the output chunks from the embeddings
+                computed for clustering, see `merge_embeddings`. Defaults to False.
 
     Returns:
             List[Chunk]: A list of all the (merged) chunks extracted from the given file.
@@ -36,33 +49,39 @@ def cluster_chunks(
     chunks = [chunk for chunk in chunks if chunk.token_count > 0]  # type: ignore
     if len(chunks) < 2:
         out_chunks = chunks
+        if embed_chunks and chunks:
+            chunks[0].embedding = embedding_model.encode([chunks[0].text], normalize_embeddings=True)[0]
     else:
         token_counts = [chunk.token_count for chunk in chunks]  # type: ignore
         # calculate simple vector embedding and distances between adjacent chunks
 
-        chunk_embedding = embedding_model.encode([chunk.text for chunk in chunks])
+        chunk_embedding = embedding_model.encode(
+            [chunk.text for chunk in chunks],
+            batch_size=embedding_batch_size,
+            normalize_embeddings=True,
+        )
+        pair_embed_dist = compute_pair_embed_dist(chunk_embedding)
+
+        num_clusters = round(np.sum(token_counts) / desired_chunk_size)  # type: ignore
+        if strategy == "adjacent":
+            compute_clusters = compute_adjacent_clusters
+        elif strategy == "hierarchical":
+            compute_clusters = compute_hierarchical_clusters
+        else:
+            raise ValueError(f"Unknown clustering strategy {strategy}")
 
-        pair_embed_dist = [0] + [
-            scipy.spatial.distance.cosine(chunk_embedding[i], chunk_embedding[i + 1]) for i in range(len(chunks) - 1)
-        ]
-        # create distance vector (upper triangular) by combining the token counts with embedding distance
-        dist_triu = create_pdist(
+        out_clusters = compute_clusters(
             token_counts=token_counts,
             pair_embed_dist=pair_embed_dist,
+            num_clusters=num_clusters,
             weight_embed_dist=dist_weight_split,
             use_log=dist_use_log,
         )
-
-        # cluster the small chunks and cut tree based on desired chunk size
-        # Distance approach is Farthest Point Algorithm (complete linkage) which
-        # gets the maximum distance between all the points in the cluster
-        hc = scipy.cluster.hierarchy.linkage(dist_triu, "complete")
-        num_clusters = round(np.sum(token_counts) / desired_chunk_size)  # type: ignore
-        out_clusters = [lab[0] for lab in scipy.cluster.hierarchy.cut_tree(hc, n_clusters=num_clusters)]
         # merge clusters and create output chunks
         out_chunks = []
         for i, clust in enumerate(np.unique(out_clusters)):
-            chunks_in = list(compress(chunks, out_clusters == clust))
+            in_cluster = out_clusters == clust
+            chunks_in = list(compress(chunks, in_cluster))
             # if there is only one chunk in the cluster, just use it
             if len(chunks_in) == 1:
                 new_chunk = chunks_in[0]
@@ -76,10 +95,136 @@ def cluster_chunks(
                     metadata=reduce(Metadata.merge, [chunk.metadata for chunk in chunks_in]),
                     creator_user_uuid=chunks_in[0].creator_user_uuid,
                 )
+            if embed_chunks:
+                new_chunk.embedding = merge_embeddings(chunk_embedding[in_cluster], np.array(token_counts)[in_cluster])
             out_chunks.append(new_chunk)
     return out_chunks
 
 
+def merge_embeddings(normalised_embedding: np.ndarray, token_counts: ArrayLike) -> np.ndarray:
+    """Approximate the embedding of some merged chunks from the embeddings of the chunks themselves
+
+    This is the token count weighted mean of the chunk embeddings, normalised to unit length. It is not
+    the same as encoding the merged text, but as the chunks were merged for being semantically similar
+    it points in much the same direction, and it saves encoding the document a second time.
+
+    Args:
+        normalised_embedding (np.ndarray): unit length embedding of each chunk, one per row
+        token_counts (ArrayLike): the token count of each chunk
+
+    Returns:
+        np.ndarray: the float32 unit length embedding of the merged chunk
+    """
+    merged = np.average(normalised_embedding, axis=0, weights=token_counts)
+    norm = np.linalg.norm(merged)
+    if norm > 0:
+        merged = merged / norm
+    return merged.astype(np.float32)
+
+
+def compute_pair_embed_dist(normalised_embedding: np.ndarray) -> np.ndarray:
+    """Cosine distance between each chunk and the one before it, 0 for the first chunk
+
+    Args:
+        normalised_embedding (np.ndarray): unit length embedding of each chunk, one per row
+
+    Returns:
+        np.ndarray: vector with the same length as the number of chunks
+    """
+    # for unit vectors the cosine distance is 1 - their dot product, computed row-wise for all adjacent pairs at once
+    similarity = np.einsum("ij,ij->i", normalised_embedding[:-1], normalised_embedding[1:])
+    return np.concatenate(([0], np.clip(1 - similarity, 0, 2)))
+
+
+def compute_hierarchical_clusters(
+    token_counts: ArrayLike,
+    pair_embed_dist: ArrayLike,
+    num_clusters: int,
+    weight_embed_dist: float = 0.2,
+    use_log: bool = True,
+) -> ArrayLike:
+    """Cluster label for each chunk, using scipy's complete linkage over the full distance matrix"""
+    # create distance vector (upper triangular) by combining the token counts with embedding distance
+    dist_triu = create_pdist(
+        token_counts=token_counts,
+        pair_embed_dist=pair_embed_dist,
+        weight_embed_dist=weight_embed_dist,
+        use_log=use_log,
+    )
+
+    # cluster the small chunks and cut tree based on desired chunk size
+    # Distance approach is Farthest Point Algorithm (complete linkage) which
+    # gets the maximum distance between all the points in the cluster
+    hc = scipy.cluster.hierarchy.linkage(dist_triu, "complete")
+    return np.array([lab[0] for lab in scipy.cluster.hierarchy.cut_tree(hc, n_clusters=num_clusters)])
+
+
+def compute_adjacent_clusters(
+    token_counts: ArrayLike,
+    pair_embed_dist: ArrayLike,
+    num_clusters: int,
+    weight_embed_dist: float = 0.2,
+    use_log: bool = True,
+) -> ArrayLike:
+    """Cluster label for each chunk, by repeatedly merging the closest pair of neighbouring clusters
+
+    This gives the same result as `compute_hierarchical_clusters` in O(n log n) time and O(n) memory.
+    The distance between two chunks (see `create_pdist`) only grows as the span of text between them grows,
+    so complete linkage always prefers to merge neighbouring clusters, and the complete linkage distance
+    between two neighbours is just the distance between the first chunk of one and the last of the other.
+    Only the distances to the two new neighbours need recomputing after a merge, so these are kept in a heap.
+    """
+    n = len(token_counts)
+    num_clusters = min(max(num_clusters, 1), n)
+
+    def distance(embed_dist: float, token_dist: float) -> float:
+        if use_log:
+            embed_dist, token_dist = math.log(embed_dist + 1), math.log(token_dist + 1)
+        return embed_dist * weight_embed_dist + token_dist * (1 - weight_embed_dist)
+
+    # clusters are contiguous runs of chunks, identified by their first chunk
+    cluster_tokens = [float(token_count) for token_count in token_counts]
+    # the maximum of the pairwise embedding distances within a cluster
+    cluster_embed_dist = [0.0] * n
+    next_cluster = list(range(1, n + 1))
+    prev_cluster = list(range(-1, n - 1))
+    # incremented every time a cluster changes, to invalidate heap entries
+    version = [0] * n
+
+    def merge_candidate(left: int, right: int) -> tuple[float, int, int, int, int]:
+        embed_dist = max(cluster_embed_dist[left], cluster_embed_dist[right], pair_embed_dist[right])
+        token_dist = cluster_tokens[left] + cluster_tokens[right]
+        return distance(embed_dist, token_dist), left, right, version[left], version[right]
+
+    heap = [merge_candidate(i, i + 1) for i in range(n - 1)]
+    heapq.heapify(heap)
+
+    for _ in range(n - num_clusters):
+        while True:
+            _, left, right, left_version, right_version = heapq.heappop(heap)
+            if version[left] == left_version and version[right] == right_version:
+                break
+
+        # merge right into left
+        cluster_embed_dist[left] = max(cluster_embed_dist[left], cluster_embed_dist[right], pair_embed_dist[right])
+        cluster_tokens[left] += cluster_tokens[right]
+        version[left] += 1
+        version[right] = -1
+        next_cluster[left] = next_cluster[right]
+        if next_cluster[left] < n:
+            prev_cluster[next_cluster[left]] = left
+            heapq.heappush(heap, merge_candidate(left, next_cluster[left]))
+        if prev_cluster[left] >= 0:
+            heapq.heappush(heap, merge_candidate(prev_cluster[left], left))
+
+    labels = np.empty(n, dtype=int)
+    cluster, label = 0, 0
+    while cluster < n:
+        labels[cluster : next_cluster[cluster]] = label
+        cluster, label = next_cluster[cluster], label + 1
+    return labels
+
+
 def compute_embed_dist(pair_embed_dist: ArrayLike) -> ArrayLike:
     n = len(pair_embed_dist)
     # embedding distance between chunk i and j is taken as MAXIMUM of the pairwise embedding
@@ -36,6 +36,7 @@ class ContentType(str, Enum):
 def chunk_file(
     file: File,
     embedding_model: Optional[SentenceTransformer] = None,
+    embed_chunks: bool = False,
 ) -> list[Chunk]:
     """
     Args:
@@ -43,6 +44,8 @@ def chunk_file(
         embedding_model (SentenceTransformer): The model to use
             to merge small semantically similar chunks, if not
             specified, not clustering will happen.
+        embed_chunks (bool): Whether to set the chunk embeddings
+            from the clustering pass, requires an embedding_model.
     Raises:
         ValueError: Will raise when a file is not supported.
 
@@ -52,6 +55,6 @@ def chunk_file(
     chunks = other_chunker(file)
 
     if embedding_model is not None:
-        chunks = cluster_chunks(chunks, embedding_model=embedding_model)
+        chunks = cluster_chunks(chunks, embedding_model=embedding_model, embed_chunks=embed_chunks)
 
     return chunks
@@ -1,7 +1,23 @@
+from redbox.storage.async_elasticsearch import AsyncElasticsearchStorageHandler
+from redbox.storage.backends import get_async_storage_handler
 from redbox.storage.elasticsearch import ElasticsearchStorageHandler
-from redbox.storage.storage_handler import BaseStorageHandler
+from redbox.storage.local import (
+    InMemoryStorageHandler,
+    LocalStorageHandler,
+    SQLiteStorageHandler,
+    ThreadedStorageHandler,
+)
+from redbox.storage.storage_handler import MAX_CHUNK_STATUSES_WINDOW, BaseStorageHandler, ItemNotFoundError
 
 __all__ = [
+    "AsyncElasticsearchStorageHandler",
     "BaseStorageHandler",
     "ElasticsearchStorageHandler",
+    "InMemoryStorageHandler",
+    "ItemNotFoundError",
+    "LocalStorageHandler",
+    "MAX_CHUNK_STATUSES_WINDOW",
+    "SQLiteStorageHandler",
+    "ThreadedStorageHandler",
+    "get_async_storage_handler",
 ]
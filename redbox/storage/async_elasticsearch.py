@@ -0,0 +1,208 @@
+import logging
+from typing import Optional
+from uuid import UUID
+
+from elastic_transport import ObjectApiResponse
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch.helpers import async_scan, async_streaming_bulk
+
+from redbox.models import Chunk, FileStatus
+from redbox.models.base import PersistableModel
+from redbox.storage.elasticsearch import BaseElasticsearchStorageHandler
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+
+class AsyncElasticsearchStorageHandler(BaseElasticsearchStorageHandler):
+    """Storage Handler for Elasticsearch, on the AsyncElasticsearch client
+
+    This has the same methods as ElasticsearchStorageHandler, but each is a coroutine, so that
+    the event loop is free to run other requests while this waits on Elasticsearch.
+    """
+
+    es_client: AsyncElasticsearch
+
+    async def close(self) -> None:
+        await self.es_client.close()
+
+    async def refresh(self, index: str = "*") -> ObjectApiResponse:
+        return await self.es_client.indices.refresh(index=f"{self.root_index}-{index}")
+
+    async def write_item(self, item: PersistableModel) -> ObjectApiResponse:
+        resp = await self.es_client.index(
+            index=self._target_index(item.model_type),
+            id=str(item.uuid),
+            body=item.model_dump_json(),
+        )
+        return resp
+
+    async def write_items(self, items: list[PersistableModel]) -> list[dict]:
+        return await self._bulk(self._index_actions(items))
+
+    async def _bulk(self, actions: list[dict]) -> list[dict]:
+        """Send actions to the _bulk API in batches, see BaseElasticsearchStorageHandler._bulk_kwargs
+
+        Args:
+            actions (list[dict]): bulk actions, see elasticsearch.helpers.async_streaming_bulk
+
+        Returns:
+            list[dict]: the per-item bulk response, in the same order as the actions
+        """
+        responses = [
+            response
+            async for response in async_streaming_bulk(client=self.es_client, actions=actions, **self._bulk_kwargs())
+        ]
+        return self._bulk_results(actions, responses)
+
+    async def read_item(self, item_uuid: UUID, model_type: str):
+        result = await self.es_client.get(index=self._target_index(model_type), id=str(item_uuid))
+        model = self.get_model_by_model_type(model_type)
+        item = model.model_validate(result.body["_source"])
+        return item
+
+    async def read_items(
+        self,
+        item_uuids: list[UUID],
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ):
+        result = await self.es_client.mget(
+            index=self._target_index(model_type),
+            body={"ids": list(map(str, item_uuids))},
+            **self._source_filter(model_type, include_fields, exclude_fields),
+        )
+        return self._mget_items(result.body["docs"], model_type)
+
+    async def update_item(self, item: PersistableModel) -> ObjectApiResponse:
+        resp = await self.es_client.index(
+            index=self._target_index(item.model_type),
+            id=str(item.uuid),
+            body=item.model_dump_json(),
+        )
+        return resp
+
+    async def update_items(self, items: list[PersistableModel]) -> list[dict]:
+        return await self._bulk(self._index_actions(items))
+
+    async def update_fields(self, item_uuid: UUID, model_type: str, fields: dict) -> ObjectApiResponse:
+        resp = await self.es_client.update(index=self._target_index(model_type), id=str(item_uuid), doc=fields)
+        return resp
+
+    async def bulk_update_fields(self, fields_by_uuid: dict[UUID, dict], model_type: str) -> list[dict]:
+        return await self._bulk(self._update_fields_actions(fields_by_uuid, model_type))
+
+    async def delete_item(self, item: PersistableModel) -> ObjectApiResponse:
+        result = await self.es_client.delete(index=self._target_index(item.model_type), id=str(item.uuid))
+        return result
+
+    async def delete_items(self, items: list[PersistableModel]) -> Optional[ObjectApiResponse]:
+        if not items:
+            return None
+
+        result = await self.es_client.delete_by_query(
+            index=self._target_index(items[0].model_type),
+            body=self._delete_items_query(items),
+        )
+        return result
+
+    async def read_all_items(
+        self,
+        model_type: str,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[PersistableModel]:
+        target_index = self._target_index(model_type)
+        try:
+            results = [
+                item
+                async for item in async_scan(
+                    client=self.es_client,
+                    index=target_index,
+                    query=self._user_items_query(user_uuid),
+                    **self._source_filter(model_type, include_fields, exclude_fields),
+                )
+            ]
+        except NotFoundError:
+            log.info("Index %s not found. Returning empty list.", target_index)
+            return []
+
+        return self._scanned_items(results, model_type)
+
+    async def list_all_items(self, model_type: str, user_uuid: UUID) -> list[UUID]:
+        target_index = self._target_index(model_type)
+        try:
+            # Only return _id
+            uuids = [
+                UUID(item["_id"])
+                async for item in async_scan(
+                    client=self.es_client,
+                    index=target_index,
+                    query=self._user_items_query(user_uuid),
+                    _source=False,
+                )
+            ]
+        except NotFoundError:
+            log.info("Index %s not found. Returning empty list.", target_index)
+            return []
+        return uuids
+
+    async def get_file_chunks(  # type: ignore[override]
+        self,
+        parent_file_uuid: UUID,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[Chunk]:
+        """get chunks for a given file"""
+        target_index = f"{self.root_index}-chunk"
+
+        res = [
+            Chunk.model_validate(item["_source"])
+            async for item in async_scan(
+                client=self.es_client,
+                index=target_index,
+                query={"query": self._file_chunks_query(parent_file_uuid, user_uuid)},
+                **self._source_filter("Chunk", include_fields, exclude_fields),
+            )
+        ]
+        return res
+
+    async def get_file_status(  # type: ignore[override]
+        self,
+        file_uuid: UUID,
+        user_uuid: UUID,
+        include_chunk_statuses: bool = False,
+        chunk_statuses_offset: int = 0,
+        chunk_statuses_limit: int = 100,
+    ) -> FileStatus:
+        """Get the status of a file and associated Chunks, see ElasticsearchStorageHandler.get_file_status
+
+        Args:
+            file_uuid (UUID): The UUID of the file to get the status of
+            user_uuid (UUID): the UUID of the user
+            include_chunk_statuses (bool): Whether to return a page of chunk statuses. Defaults to False.
+            chunk_statuses_offset (int): Offset of the first chunk status, in chunk index order. Defaults to 0.
+            chunk_statuses_limit (int): Max number of chunk statuses to return. Defaults to 100.
+
+        Returns:
+            FileStatus: The status of the file
+        """
+        try:
+            file = await self.read_item(file_uuid, "File")
+        except NotFoundError as e:
+            log.error("file/%s not found", file_uuid)
+            raise ValueError(f"File {file_uuid} not found") from e
+        self._check_file_owner(file, user_uuid)
+
+        try:
+            result = await self.es_client.search(
+                **self._file_status_search(file, include_chunk_statuses, chunk_statuses_offset, chunk_statuses_limit)
+            )
+        except NotFoundError:
+            log.info("Index %s-chunk not found. Returning chunking status.", self.root_index)
+            result = None
+
+        return self._file_status(file_uuid, result, include_chunk_statuses)
@@ -0,0 +1,14 @@
+from redbox.models import Settings
+from redbox.storage.async_elasticsearch import AsyncElasticsearchStorageHandler
+from redbox.storage.local import InMemoryStorageHandler, SQLiteStorageHandler, ThreadedStorageHandler
+
+
+def get_async_storage_handler(
+    env: Settings, root_index: str = "redbox-data"
+) -> AsyncElasticsearchStorageHandler | ThreadedStorageHandler:
+    """The storage handler for `env.storage_backend`, with coroutine methods for the worker and core-api"""
+    if env.storage_backend == "memory":
+        return ThreadedStorageHandler(InMemoryStorageHandler(root_index=root_index))
+    if env.storage_backend == "sqlite":
+        return ThreadedStorageHandler(SQLiteStorageHandler(env.sqlite_path, root_index=root_index))
+    return AsyncElasticsearchStorageHandler(es_client=env.async_elasticsearch_client(), root_index=root_index)
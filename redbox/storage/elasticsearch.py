@@ -1,184 +1,410 @@
 import logging
+from collections import defaultdict
 from typing import Optional
 from uuid import UUID
 
 from elastic_transport import ObjectApiResponse
-from elasticsearch import Elasticsearch, NotFoundError
-from elasticsearch.helpers import scan
+from elasticsearch import AsyncElasticsearch, Elasticsearch, NotFoundError
+from elasticsearch.helpers import scan, streaming_bulk
 from pydantic import ValidationError
 
-from redbox.models import Chunk, ChunkStatus, FileStatus, ProcessingStatusEnum
+from redbox.models import Chunk, ChunkStatus, File, FileStatus, ProcessingStatusEnum
 from redbox.models.base import PersistableModel
-from redbox.storage.storage_handler import BaseStorageHandler
+from redbox.storage.storage_handler import MAX_CHUNK_STATUSES_WINDOW, BaseStorageHandler
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
+# bulk items rejected by a cluster that is too busy, or that failed on the server, are worth
+# retrying, unlike those failing with a mapping error or updating a missing document
+BULK_RETRY_ON_STATUS = (429, *range(500, 600))
 
-class ElasticsearchStorageHandler(BaseStorageHandler):
-    """Storage Handler for Elasticsearch"""
+
+class BaseElasticsearchStorageHandler(BaseStorageHandler):
+    """What the sync and async Elasticsearch storage handlers share: the indices, and building
+    the requests and reading the responses, everything but the I/O itself"""
 
     def __init__(
         self,
-        es_client: Elasticsearch,
+        es_client: Elasticsearch | AsyncElasticsearch,
         root_index: str = "redbox",
+        bulk_chunk_size: int = 500,
+        bulk_max_chunk_bytes: int = 10 * 1024 * 1024,
+        bulk_max_retries: int = 2,
+        bulk_initial_backoff: float = 2,
+        bulk_max_backoff: float = 60,
     ):
         """Initialise the storage handler
 
         Args:
-            es_client (Elasticsearch): Elasticsearch client
+            es_client (Elasticsearch | AsyncElasticsearch): Elasticsearch client
             root_index (str, optional): Root index to use. Defaults to "redbox".
+            bulk_chunk_size (int, optional): Max number of documents per _bulk request. Defaults to 500.
+            bulk_max_chunk_bytes (int, optional): Max size of a _bulk request in bytes. Defaults to 10MB.
+            bulk_max_retries (int, optional): Number of times items that failed in a _bulk request
+                with a status in BULK_RETRY_ON_STATUS are retried. Defaults to 2.
+            bulk_initial_backoff (float, optional): Seconds to wait before the first retry, doubling
+                for each retry after it. Defaults to 2.
+            bulk_max_backoff (float, optional): Max seconds to wait before a retry. Defaults to 60.
         """
         self.es_client = es_client
         self.root_index = root_index
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_max_chunk_bytes = bulk_max_chunk_bytes
+        self.bulk_max_retries = bulk_max_retries
+        self.bulk_initial_backoff = bulk_initial_backoff
+        self.bulk_max_backoff = bulk_max_backoff
+
+    def _bulk_kwargs(self) -> dict:
+        """Arguments for streaming_bulk and async_streaming_bulk, which retry the items that
+        failed with a status in BULK_RETRY_ON_STATUS, with exponential backoff
+
+        Connection errors are retried by the client's own transport.
+        """
+        return {
+            "chunk_size": self.bulk_chunk_size,
+            "max_chunk_bytes": self.bulk_max_chunk_bytes,
+            "raise_on_error": False,
+            "raise_on_exception": False,
+            "max_retries": self.bulk_max_retries,
+            "initial_backoff": self.bulk_initial_backoff,
+            "max_backoff": self.bulk_max_backoff,
+            "retry_on_status": BULK_RETRY_ON_STATUS,
+        }
+
+    @staticmethod
+    def _bulk_results(actions: list[dict], responses: list[tuple[bool, dict]]) -> list[dict]:
+        """The per-item bulk responses in the same order as the actions, as retried items come
+        back after the rest, logging the items that failed"""
+        positions: dict[str, list[int]] = defaultdict(list)
+        for i, action in enumerate(actions):
+            positions[action["_id"]].append(i)
+
+        results: list[dict] = [{} for _ in actions]
+        for ok, response in responses:
+            ((op_type, info),) = response.items()
+            results[positions[info["_id"]].pop(0)] = response
+            if not ok:
+                log.error("bulk %s of %s failed: %s", op_type, info["_id"], info)
+        return results
+
+    def _target_index(self, model_type: str) -> str:
+        return f"{self.root_index}-{model_type.lower()}"
+
+    def _index_actions(self, items: list[PersistableModel]) -> list[dict]:
+        return [
+            {
+                "_op_type": "index",
+                "_index": self._target_index(item.model_type),
+                "_id": str(item.uuid),
+                "_source": item.model_dump_json(),
+            }
+            for item in items
+        ]
+
+    def _update_fields_actions(self, fields_by_uuid: dict[UUID, dict], model_type: str) -> list[dict]:
+        return [
+            {
+                "_op_type": "update",
+                "_index": self._target_index(model_type),
+                "_id": str(item_uuid),
+                "doc": fields,
+            }
+            for item_uuid, fields in fields_by_uuid.items()
+        ]
+
+    def _source_filter(
+        self,
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> dict:
+        source_filter = {}
+        if include_fields is not None:
+            source_filter["source_includes"] = self.get_source_includes(model_type, include_fields)
+        if exclude_fields:
+            source_filter["source_excludes"] = exclude_fields
+        return source_filter
+
+    def _mget_items(self, docs: list[dict], model_type: str) -> list[PersistableModel]:
+        model = self.get_model_by_model_type(model_type)
+        items = []
+        for item in docs:
+            if not item.get("found"):
+                log.warning("%s/%s not found", model_type, item["_id"])
+                continue
+            items.append(model.model_validate(item["_source"]))
+        return items
+
+    def _scanned_items(self, hits: list[dict], model_type: str) -> list[PersistableModel]:
+        model = self.get_model_by_model_type(model_type)
+        items = []
+        for item in hits:
+            try:
+                items.append(model.model_validate(item["_source"]))
+            except ValidationError as e:
+                logging.error(e)
+        return items
+
+    @staticmethod
+    def _user_items_query(user_uuid: UUID) -> dict:
+        return {"query": {"match": {"creator_user_uuid": str(user_uuid)}}}
+
+    @staticmethod
+    def _delete_items_query(items: list[PersistableModel]) -> dict:
+        if len({item.model_type for item in items}) > 1:
+            raise ValueError("Items with differing model types: {item.model_type for item in items}")
+        return {"query": {"terms": {"_id": [str(item.uuid) for item in items]}}}
+
+    @staticmethod
+    def _file_chunks_query(parent_file_uuid: UUID, user_uuid: UUID) -> dict:
+        return {
+            "bool": {
+                "must": [
+                    {
+                        "match": {
+                            "parent_file_uuid": str(parent_file_uuid),
+                        }
+                    },
+                    {
+                        "match": {
+                            "creator_user_uuid": str(user_uuid),
+                        }
+                    },
+                ]
+            }
+        }
+
+    def _check_file_owner(self, file: File, user_uuid: UUID) -> None:
+        if file.creator_user_uuid != user_uuid:
+            log.error("file/%s.%s not owned by %s", file.uuid, file.creator_user_uuid, user_uuid)
+            raise ValueError(f"File {file.uuid} not found")
+
+    def _file_status_search(
+        self,
+        file: File,
+        include_chunk_statuses: bool,
+        chunk_statuses_offset: int,
+        chunk_statuses_limit: int,
+    ) -> dict:
+        """The search that counts the chunks, and the embedded chunks, for the file"""
+        query = self._file_chunks_query(file.uuid, file.creator_user_uuid)
+        # the named `should` clause doesn't change which chunks match, it only flags the embedded ones
+        query["bool"]["should"] = [{"exists": {"field": "embedding", "_name": "embedded"}}]
+        search = {
+            "index": f"{self.root_index}-chunk",
+            "query": query,
+            "aggs": {"embedded": {"filter": {"exists": {"field": "embedding"}}}},
+            "track_total_hits": True,
+            "source": False,
+            "size": 0,
+        }
+        if include_chunk_statuses:
+            if chunk_statuses_offset + chunk_statuses_limit > MAX_CHUNK_STATUSES_WINDOW:
+                raise ValueError(f"offset + limit must be no more than {MAX_CHUNK_STATUSES_WINDOW}")
+            search |= {"sort": [{"index": "asc"}], "from_": chunk_statuses_offset, "size": chunk_statuses_limit}
+        return search
+
+    @staticmethod
+    def _file_status(file_uuid: UUID, result: Optional[ObjectApiResponse], include_chunk_statuses: bool) -> FileStatus:
+        """The status of the file from the result of `_file_status_search`, or None when there
+        is no chunk index yet"""
+        if result is None:
+            return FileStatus(
+                file_uuid=file_uuid,
+                processing_status=ProcessingStatusEnum.chunking,
+                chunk_statuses=[] if include_chunk_statuses else None,
+            )
+
+        chunk_count = result["hits"]["total"]["value"]
+        embedded_chunk_count = result["aggregations"]["embedded"]["doc_count"]
+
+        chunk_statuses = None
+        if include_chunk_statuses:
+            chunk_statuses = [
+                ChunkStatus(chunk_uuid=hit["_id"], embedded="embedded" in hit.get("matched_queries", []))
+                for hit in result["hits"]["hits"]
+            ]
+
+        # Test 3: Determine the latest status
+        if not chunk_count:
+            processing_status = ProcessingStatusEnum.chunking
+        elif embedded_chunk_count < chunk_count:
+            processing_status = ProcessingStatusEnum.embedding
+        else:
+            processing_status = ProcessingStatusEnum.complete
+
+        return FileStatus(
+            file_uuid=file_uuid,
+            processing_status=processing_status,
+            chunk_count=chunk_count,
+            embedded_chunk_count=embedded_chunk_count,
+            chunk_statuses=chunk_statuses,
+        )
+
+
+class ElasticsearchStorageHandler(BaseElasticsearchStorageHandler):
+    """Storage Handler for Elasticsearch"""
+
+    es_client: Elasticsearch
 
     def refresh(self, index: str = "*") -> ObjectApiResponse:
         return self.es_client.indices.refresh(index=f"{self.root_index}-{index}")
 
     def write_item(self, item: PersistableModel) -> ObjectApiResponse:
-        target_index = f"{self.root_index}-{item.model_type.lower()}"
-
         resp = self.es_client.index(
-            index=target_index,
+            index=self._target_index(item.model_type),
             id=str(item.uuid),
             body=item.model_dump_json(),
         )
         return resp
 
-    def write_items(self, items: list[PersistableModel]) -> list:
-        return list(map(self.write_item, items))
+    def write_items(self, items: list[PersistableModel]) -> list[dict]:
+        return self._bulk(self._index_actions(items))
 
-    def read_item(self, item_uuid: UUID, model_type: str):
-        target_index = f"{self.root_index}-{model_type.lower()}"
-        result = self.es_client.get(index=target_index, id=str(item_uuid))
-        model = self.get_model_by_model_type(model_type)
-        item = model(**result.body["_source"])
-        return item
+    def _bulk(self, actions: list[dict]) -> list[dict]:
+        """Send actions to the _bulk API in batches, see BaseElasticsearchStorageHandler._bulk_kwargs
 
-    def read_items(self, item_uuids: list[UUID], model_type: str):
-        target_index = f"{self.root_index}-{model_type.lower()}"
-        result = self.es_client.mget(index=target_index, body={"ids": list(map(str, item_uuids))})
+        Args:
+            actions (list[dict]): bulk actions, see elasticsearch.helpers.streaming_bulk
+
+        Returns:
+            list[dict]: the per-item bulk response, in the same order as the actions
+        """
+        responses = list(streaming_bulk(client=self.es_client, actions=actions, **self._bulk_kwargs()))
+        return self._bulk_results(actions, responses)
 
+    def read_item(self, item_uuid: UUID, model_type: str):
+        result = self.es_client.get(index=self._target_index(model_type), id=str(item_uuid))
         model = self.get_model_by_model_type(model_type)
-        items = [model(**item["_source"]) for item in result.body["docs"]]
+        item = model.model_validate(result.body["_source"])
+        return item
 
-        return items
+    def read_items(
+        self,
+        item_uuids: list[UUID],
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ):
+        result = self.es_client.mget(
+            index=self._target_index(model_type),
+            body={"ids": list(map(str, item_uuids))},
+            **self._source_filter(model_type, include_fields, exclude_fields),
+        )
+        return self._mget_items(result.body["docs"], model_type)
 
     def update_item(self, item: PersistableModel) -> ObjectApiResponse:
-        target_index = f"{self.root_index}-{item.model_type.lower()}"
-
         resp = self.es_client.index(
-            index=target_index,
+            index=self._target_index(item.model_type),
             id=str(item.uuid),
-            body=item.json(),
+            body=item.model_dump_json(),
         )
         return resp
 
-    def update_items(self, items: list[PersistableModel]) -> list[ObjectApiResponse]:
-        return list(map(self.update_item, items))
+    def update_items(self, items: list[PersistableModel]) -> list[dict]:
+        return self._bulk(self._index_actions(items))
+
+    def update_fields(self, item_uuid: UUID, model_type: str, fields: dict) -> ObjectApiResponse:
+        resp = self.es_client.update(index=self._target_index(model_type), id=str(item_uuid), doc=fields)
+        return resp
+
+    def bulk_update_fields(self, fields_by_uuid: dict[UUID, dict], model_type: str) -> list[dict]:
+        return self._bulk(self._update_fields_actions(fields_by_uuid, model_type))
 
     def delete_item(self, item: PersistableModel) -> ObjectApiResponse:
-        target_index = f"{self.root_index}-{item.model_type.lower()}"
-        result = self.es_client.delete(index=target_index, id=str(item.uuid))
+        result = self.es_client.delete(index=self._target_index(item.model_type), id=str(item.uuid))
         return result
 
     def delete_items(self, items: list[PersistableModel]) -> Optional[ObjectApiResponse]:
         if not items:
             return None
 
-        if len({item.model_type for item in items}) > 1:
-            raise ValueError("Items with differing model types: {item.model_type for item in items}")
-        model_type = items[0].model_type
-        target_index = f"{self.root_index}-{model_type.lower()}"
         result = self.es_client.delete_by_query(
-            index=target_index,
-            body={"query": {"terms": {"_id": [str(item.uuid) for item in items]}}},
+            index=self._target_index(items[0].model_type),
+            body=self._delete_items_query(items),
         )
         return result
 
-    def read_all_items(self, model_type: str, user_uuid: UUID) -> list[PersistableModel]:
-        target_index = f"{self.root_index}-{model_type.lower()}"
+    def read_all_items(
+        self,
+        model_type: str,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[PersistableModel]:
+        target_index = self._target_index(model_type)
         try:
-            result = scan(
-                client=self.es_client,
-                index=target_index,
-                query={"query": {"match": {"creator_user_uuid": str(user_uuid)}}},
-                _source=True,
+            results = list(
+                scan(
+                    client=self.es_client,
+                    index=target_index,
+                    query=self._user_items_query(user_uuid),
+                    **self._source_filter(model_type, include_fields, exclude_fields),
+                )
             )
-
         except NotFoundError:
             log.info("Index %s not found. Returning empty list.", target_index)
             return []
 
-        # Grab the model we'll use to deserialize the items
-        model = self.get_model_by_model_type(model_type)
-        try:
-            results = list(result)
-        except NotFoundError:
-            return []
-
-        items = []
-        for item in results:
-            try:
-                items.append(model(**item["_source"]))
-            except ValidationError as e:
-                logging.error(e)
-        return items
+        return self._scanned_items(results, model_type)
 
     def list_all_items(self, model_type: str, user_uuid: UUID) -> list[UUID]:
-        target_index = f"{self.root_index}-{model_type.lower()}"
+        target_index = self._target_index(model_type)
         try:
             # Only return _id
             results = scan(
                 client=self.es_client,
                 index=target_index,
-                query={"query": {"match": {"creator_user_uuid": str(user_uuid)}}},
+                query=self._user_items_query(user_uuid),
                 _source=False,
             )
-
+            uuids = [UUID(item["_id"]) for item in results]
         except NotFoundError:
             log.info("Index %s not found. Returning empty list.", target_index)
             return []
-        uuids = [UUID(item["_id"]) for item in results]
         return uuids
 
-    def get_file_chunks(self, parent_file_uuid: UUID, user_uuid: UUID) -> list[Chunk]:
+    def get_file_chunks(
+        self,
+        parent_file_uuid: UUID,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[Chunk]:
         """get chunks for a given file"""
         target_index = f"{self.root_index}-chunk"
 
         res = [
-            Chunk(**item["_source"])
+            Chunk.model_validate(item["_source"])
             for item in scan(
                 client=self.es_client,
                 index=target_index,
-                query={
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {
-                                    "match": {
-                                        "parent_file_uuid": str(parent_file_uuid),
-                                    }
-                                },
-                                {
-                                    "match": {
-                                        "creator_user_uuid": str(user_uuid),
-                                    }
-                                },
-                            ]
-                        }
-                    }
-                },
+                query={"query": self._file_chunks_query(parent_file_uuid, user_uuid)},
+                **self._source_filter("Chunk", include_fields, exclude_fields),
             )
         ]
         return res
 
-    def get_file_status(self, file_uuid: UUID, user_uuid: UUID) -> FileStatus:
+    def get_file_status(
+        self,
+        file_uuid: UUID,
+        user_uuid: UUID,
+        include_chunk_statuses: bool = False,
+        chunk_statuses_offset: int = 0,
+        chunk_statuses_limit: int = 100,
+    ) -> FileStatus:
         """Get the status of a file and associated Chunks
 
+        The chunk totals come from a single search with a filter aggregation, so no
+        chunk documents are returned unless `include_chunk_statuses` is set.
+
         Args:
             file_uuid (UUID): The UUID of the file to get the status of
             user_uuid (UUID): the UUID of the user
+            include_chunk_statuses (bool): Whether to return a page of chunk statuses. Defaults to False.
+            chunk_statuses_offset (int): Offset of the first chunk status, in chunk index order. Defaults to 0.
+            chunk_statuses_limit (int): Max number of chunk statuses to return. Defaults to 100.
 
         Returns:
             FileStatus: The status of the file
@@ -190,29 +416,15 @@ class ElasticsearchStorageHandler(BaseStorageHandler):
         except NotFoundError as e:
             log.error("file/%s not found", file_uuid)
             raise ValueError(f"File {file_uuid} not found") from e
-        if file.creator_user_uuid != user_uuid:
-            log.error("file/%s.%s not owned by %s", file_uuid, file.creator_user_uuid, user_uuid)
-            raise ValueError(f"File {file_uuid} not found")
+        self._check_file_owner(file, user_uuid)
 
-        # Test 2: Get the number of chunks for the file
-        chunks = self.get_file_chunks(file_uuid, file.creator_user_uuid)
-
-        if not chunks:
-            # File has not been chunked yet
-            return FileStatus(
-                file_uuid=file_uuid,
-                chunk_statuses=[],
-                processing_status=ProcessingStatusEnum.chunking,
+        # Test 2: Count the chunks, and the embedded chunks, for the file
+        try:
+            result = self.es_client.search(
+                **self._file_status_search(file, include_chunk_statuses, chunk_statuses_offset, chunk_statuses_limit)
             )
+        except NotFoundError:
+            log.info("Index %s-chunk not found. Returning chunking status.", self.root_index)
+            result = None
 
-        # Test 3: Determine the number of embedded chunks for the file
-        chunk_statuses = [ChunkStatus(chunk_uuid=chunk.uuid, embedded=bool(chunk.embedding)) for chunk in chunks]
-
-        # Test 4: Determine the latest status
-        is_complete = all(chunk_status.embedded for chunk_status in chunk_statuses)
-
-        return FileStatus(
-            file_uuid=file_uuid,
-            chunk_statuses=chunk_statuses,
-            processing_status=ProcessingStatusEnum.complete if is_complete else ProcessingStatusEnum.embedding,
-        )
+        return self._file_status(file_uuid, result, include_chunk_statuses)
@@ -0,0 +1,493 @@
+import asyncio
+import logging
+import sqlite3
+from abc import abstractmethod
+from threading import RLock
+from typing import Optional
+from uuid import UUID
+
+import numpy as np
+import orjson
+
+from redbox.models import Chunk, ChunkStatus, File, FileStatus, ProcessingStatusEnum
+from redbox.models.base import PersistableModel
+from redbox.storage.storage_handler import BaseStorageHandler, ItemNotFoundError
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+
+class LocalStorageHandler(BaseStorageHandler):
+    """Storage Handler that keeps the JSON source of each item by index and id, as Elasticsearch
+    does, but in this process rather than a cluster, for running locally and for benchmarks.
+
+    Subclasses say where the sources are kept, this does everything else, including searching
+    chunks by their embeddings with a brute force kNN.
+    """
+
+    def __init__(self, root_index: str = "redbox"):
+        """Initialise the storage handler
+
+        Args:
+            root_index (str, optional): Root index to use. Defaults to "redbox".
+        """
+        self.root_index = root_index
+        self.lock = RLock()
+
+    @abstractmethod
+    def _put(self, index: str, sources: dict[str, dict]) -> None:
+        """Write the sources by id, replacing any already there"""
+
+    @abstractmethod
+    def _get(self, index: str, ids: list[str]) -> dict[str, dict]:
+        """Read the sources that exist for the ids"""
+
+    @abstractmethod
+    def _delete(self, index: str, ids: list[str]) -> int:
+        """Delete the sources for the ids, returning the number deleted"""
+
+    @abstractmethod
+    def _scan(self, index: str, creator_user_uuid: UUID, parent_file_uuid: Optional[UUID] = None) -> dict[str, dict]:
+        """Read the sources created by the user, optionally only the chunks of a file"""
+
+    def close(self) -> None:
+        """Release anything held by the storage handler"""
+
+    def _target_index(self, model_type: str) -> str:
+        return f"{self.root_index}-{model_type.lower()}"
+
+    def _filter_source(
+        self,
+        source: dict,
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> dict:
+        if include_fields is not None:
+            includes = self.get_source_includes(model_type, include_fields)
+            source = {name: value for name, value in source.items() if name in includes}
+        if exclude_fields:
+            source = {name: value for name, value in source.items() if name not in exclude_fields}
+        return source
+
+    def refresh(self, index: str = "*") -> None:
+        """Writes can be read straight away, so there is nothing to refresh"""
+
+    def write_item(self, item: PersistableModel) -> dict:
+        return self.write_items([item])[0]
+
+    def write_items(self, items: list[PersistableModel]) -> list[dict]:
+        sources_by_index: dict[str, dict[str, dict]] = {}
+        for item in items:
+            sources_by_index.setdefault(self._target_index(item.model_type), {})[str(item.uuid)] = item.model_dump(
+                mode="json"
+            )
+        with self.lock:
+            for index, sources in sources_by_index.items():
+                self._put(index, sources)
+        return [{"index": {"_id": str(item.uuid), "status": 201}} for item in items]
+
+    def read_item(self, item_uuid: UUID, model_type: str):
+        with self.lock:
+            sources = self._get(self._target_index(model_type), [str(item_uuid)])
+        if not sources:
+            raise ItemNotFoundError(f"{model_type}/{item_uuid} not found")
+        model = self.get_model_by_model_type(model_type)
+        return model.model_validate(sources[str(item_uuid)])
+
+    def read_items(
+        self,
+        item_uuids: list[UUID],
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ):
+        ids = list(map(str, item_uuids))
+        with self.lock:
+            sources = self._get(self._target_index(model_type), ids)
+
+        model = self.get_model_by_model_type(model_type)
+        items = []
+        for item_id in ids:
+            if item_id not in sources:
+                log.warning("%s/%s not found", model_type, item_id)
+                continue
+            items.append(
+                model.model_validate(self._filter_source(sources[item_id], model_type, include_fields, exclude_fields))
+            )
+        return items
+
+    def update_item(self, item: PersistableModel) -> dict:
+        return self.write_item(item)
+
+    def update_items(self, items: list[PersistableModel]) -> list[dict]:
+        return self.write_items(items)
+
+    def update_fields(self, item_uuid: UUID, model_type: str, fields: dict) -> dict:
+        result = self.bulk_update_fields({item_uuid: fields}, model_type)[0]
+        if result["update"]["status"] == 404:
+            raise ItemNotFoundError(f"{model_type}/{item_uuid} not found")
+        return result
+
+    def bulk_update_fields(self, fields_by_uuid: dict[UUID, dict], model_type: str) -> list[dict]:
+        index = self._target_index(model_type)
+        ids = list(map(str, fields_by_uuid))
+        # as JSON would have it, e.g. a float32 embedding as a list of floats
+        updates = orjson.loads(
+            orjson.dumps(dict(zip(ids, fields_by_uuid.values(), strict=True)), option=orjson.OPT_SERIALIZE_NUMPY)
+        )
+        with self.lock:
+            sources = self._get(index, ids)
+            self._put(index, {item_id: sources[item_id] | updates[item_id] for item_id in sources})
+        return [{"update": {"_id": item_id, "status": 200 if item_id in sources else 404}} for item_id in ids]
+
+    def delete_item(self, item: PersistableModel) -> dict:
+        with self.lock:
+            deleted = self._delete(self._target_index(item.model_type), [str(item.uuid)])
+        if not deleted:
+            raise ItemNotFoundError(f"{item.model_type}/{item.uuid} not found")
+        return {"_id": str(item.uuid), "result": "deleted"}
+
+    def delete_items(self, items: list[PersistableModel]) -> Optional[dict]:
+        if not items:
+            return None
+
+        model_types = {item.model_type for item in items}
+        if len(model_types) > 1:
+            raise ValueError(f"Items with differing model types: {model_types}")
+        with self.lock:
+            deleted = self._delete(self._target_index(items[0].model_type), [str(item.uuid) for item in items])
+        return {"deleted": deleted}
+
+    def read_all_items(
+        self,
+        model_type: str,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[PersistableModel]:
+        with self.lock:
+            sources = self._scan(self._target_index(model_type), user_uuid)
+        model = self.get_model_by_model_type(model_type)
+        return [
+            model.model_validate(self._filter_source(source, model_type, include_fields, exclude_fields))
+            for source in sources.values()
+        ]
+
+    def list_all_items(self, model_type: str, user_uuid: UUID) -> list[UUID]:
+        with self.lock:
+            sources = self._scan(self._target_index(model_type), user_uuid)
+        return [UUID(item_id) for item_id in sources]
+
+    def get_file_chunks(
+        self,
+        parent_file_uuid: UUID,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[Chunk]:
+        """get chunks for a given file, in index order"""
+        with self.lock:
+            sources = self._scan(self._target_index("Chunk"), user_uuid, parent_file_uuid)
+        return [
+            Chunk.model_validate(self._filter_source(source, "Chunk", include_fields, exclude_fields))
+            for source in sorted(sources.values(), key=lambda source: source["index"])
+        ]
+
+    def get_file_status(
+        self,
+        file_uuid: UUID,
+        user_uuid: UUID,
+        include_chunk_statuses: bool = False,
+        chunk_statuses_offset: int = 0,
+        chunk_statuses_limit: int = 100,
+    ) -> FileStatus:
+        """Get the status of a file and associated Chunks
+
+        Args:
+            file_uuid (UUID): The UUID of the file to get the status of
+            user_uuid (UUID): the UUID of the user
+            include_chunk_statuses (bool): Whether to return a page of chunk statuses. Defaults to False.
+            chunk_statuses_offset (int): Offset of the first chunk status, in chunk index order. Defaults to 0.
+            chunk_statuses_limit (int): Max number of chunk statuses to return. Defaults to 100.
+
+        Returns:
+            FileStatus: The status of the file
+        """
+        try:
+            file: File = self.read_item(file_uuid, "File")
+        except ItemNotFoundError as e:
+            log.error("file/%s not found", file_uuid)
+            raise ValueError(f"File {file_uuid} not found") from e
+        if file.creator_user_uuid != user_uuid:
+            log.error("file/%s.%s not owned by %s", file_uuid, file.creator_user_uuid, user_uuid)
+            raise ValueError(f"File {file_uuid} not found")
+
+        with self.lock:
+            sources = self._scan(self._target_index("Chunk"), user_uuid, file_uuid)
+        embedded = sorted(
+            ((source["index"], item_id, source.get("embedding") is not None) for item_id, source in sources.items()),
+        )
+        chunk_count = len(embedded)
+        embedded_chunk_count = sum(is_embedded for _, _, is_embedded in embedded)
+
+        chunk_statuses = None
+        if include_chunk_statuses:
+            chunk_statuses = [
+                ChunkStatus(chunk_uuid=item_id, embedded=is_embedded)
+                for _, item_id, is_embedded in embedded[
+                    chunk_statuses_offset : chunk_statuses_offset + chunk_statuses_limit
+                ]
+            ]
+
+        if not chunk_count:
+            processing_status = ProcessingStatusEnum.chunking
+        elif embedded_chunk_count < chunk_count:
+            processing_status = ProcessingStatusEnum.embedding
+        else:
+            processing_status = ProcessingStatusEnum.complete
+
+        return FileStatus(
+            file_uuid=file_uuid,
+            processing_status=processing_status,
+            chunk_count=chunk_count,
+            embedded_chunk_count=embedded_chunk_count,
+            chunk_statuses=chunk_statuses,
+        )
+
+    def search_chunks(
+        self, query_vector: list[float], user_uuid: UUID, k: int = 4, fields: Optional[list[str]] = None
+    ) -> list[dict]:
+        """The user's k embedded chunks most cosine similar to the query, by brute force
+
+        Args:
+            query_vector (list[float]): the embedding of the query
+            user_uuid (UUID): the UUID of the user
+            k (int): the number of chunks to return. Defaults to 4.
+            fields (list[str], optional): the chunk fields to return, defaults to all of them
+
+        Returns:
+            list[dict]: the chunks, most similar first, as Elasticsearch search hits
+        """
+        with self.lock:
+            sources = self._scan(self._target_index("Chunk"), user_uuid)
+        sources = {item_id: source for item_id, source in sources.items() if source.get("embedding") is not None}
+        if not sources or k <= 0:
+            return []
+
+        embeddings = np.asarray([source["embedding"] for source in sources.values()], dtype=np.float32)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+        scores = embeddings @ query / np.where(norms == 0, 1, norms)
+
+        k = min(k, len(scores))
+        nearest = np.argpartition(-scores, k - 1)[:k]
+        nearest = nearest[np.argsort(-scores[nearest])]
+
+        ids = list(sources)
+        return [
+            {
+                "_id": ids[i],
+                "_score": float(scores[i]),
+                "_source": {name: value for name, value in sources[ids[i]].items() if fields is None or name in fields},
+            }
+            for i in nearest
+        ]
+
+
+class InMemoryStorageHandler(LocalStorageHandler):
+    """Storage Handler that keeps everything in a dict, for tests and benchmarks in a single process"""
+
+    def __init__(self, root_index: str = "redbox"):
+        super().__init__(root_index=root_index)
+        self.indices: dict[str, dict[str, dict]] = {}
+
+    def _put(self, index: str, sources: dict[str, dict]) -> None:
+        self.indices.setdefault(index, {}).update(sources)
+
+    def _get(self, index: str, ids: list[str]) -> dict[str, dict]:
+        sources = self.indices.get(index, {})
+        return {item_id: sources[item_id] for item_id in ids if item_id in sources}
+
+    def _delete(self, index: str, ids: list[str]) -> int:
+        sources = self.indices.get(index, {})
+        return sum(sources.pop(item_id, None) is not None for item_id in ids)
+
+    def _scan(self, index: str, creator_user_uuid: UUID, parent_file_uuid: Optional[UUID] = None) -> dict[str, dict]:
+        return {
+            item_id: source
+            for item_id, source in self.indices.get(index, {}).items()
+            if source["creator_user_uuid"] == str(creator_user_uuid)
+            and (parent_file_uuid is None or source.get("parent_file_uuid") == str(parent_file_uuid))
+        }
+
+
+class SQLiteStorageHandler(LocalStorageHandler):
+    """Storage Handler that keeps everything in a single SQLite file, which the worker
+    and core-api can share when they run on the same machine"""
+
+    def __init__(self, path: str, root_index: str = "redbox"):
+        """Initialise the storage handler
+
+        Args:
+            path (str): Path of the SQLite database file, created if it does not exist
+            root_index (str, optional): Root index to use. Defaults to "redbox".
+        """
+        super().__init__(root_index=root_index)
+        # used from the threads of ThreadedStorageHandler, under self.lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            # write-ahead logging lets the worker write while the core-api reads
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "index_name TEXT NOT NULL, id TEXT NOT NULL, creator_user_uuid TEXT NOT NULL, "
+                "parent_file_uuid TEXT, source BLOB NOT NULL, PRIMARY KEY (index_name, id))"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS items_by_user ON items (index_name, creator_user_uuid, parent_file_uuid)"
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _put(self, index: str, sources: dict[str, dict]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+                (
+                    (index, item_id, source["creator_user_uuid"], source.get("parent_file_uuid"), orjson.dumps(source))
+                    for item_id, source in sources.items()
+                ),
+            )
+
+    def _get(self, index: str, ids: list[str]) -> dict[str, dict]:
+        rows = self.connection.execute(
+            f"SELECT id, source FROM items WHERE index_name = ? AND id IN ({', '.join('?' * len(ids))})",  # noqa: S608
+            [index, *ids],
+        )
+        return {item_id: orjson.loads(source) for item_id, source in rows}
+
+    def _delete(self, index: str, ids: list[str]) -> int:
+        with self.connection:
+            cursor = self.connection.execute(
+                f"DELETE FROM items WHERE index_name = ? AND id IN ({', '.join('?' * len(ids))})",  # noqa: S608
+                [index, *ids],
+            )
+        return cursor.rowcount
+
+    def _scan(self, index: str, creator_user_uuid: UUID, parent_file_uuid: Optional[UUID] = None) -> dict[str, dict]:
+        if parent_file_uuid is None:
+            rows = self.connection.execute(
+                "SELECT id, source FROM items WHERE index_name = ? AND creator_user_uuid = ?",
+                [index, str(creator_user_uuid)],
+            )
+        else:
+            rows = self.connection.execute(
+                "SELECT id, source FROM items WHERE index_name = ? AND creator_user_uuid = ? AND parent_file_uuid = ?",
+                [index, str(creator_user_uuid), str(parent_file_uuid)],
+            )
+        return {item_id: orjson.loads(source) for item_id, source in rows}
+
+
+class ThreadedStorageHandler:
+    """Runs the methods of a sync storage handler in a thread, so that it can be awaited in
+    place of AsyncElasticsearchStorageHandler, e.g. `await handler.read_item(uuid, "File")`"""
+
+    def __init__(self, storage_handler: LocalStorageHandler):
+        self.storage_handler = storage_handler
+
+    @property
+    def root_index(self) -> str:
+        return self.storage_handler.root_index
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.storage_handler.close)
+
+    async def refresh(self, index: str = "*") -> None:
+        await asyncio.to_thread(self.storage_handler.refresh, index)
+
+    async def write_item(self, item: PersistableModel) -> dict:
+        return await asyncio.to_thread(self.storage_handler.write_item, item)
+
+    async def write_items(self, items: list[PersistableModel]) -> list[dict]:
+        return await asyncio.to_thread(self.storage_handler.write_items, items)
+
+    async def read_item(self, item_uuid: UUID, model_type: str):
+        return await asyncio.to_thread(self.storage_handler.read_item, item_uuid, model_type)
+
+    async def read_items(
+        self,
+        item_uuids: list[UUID],
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ):
+        return await asyncio.to_thread(
+            self.storage_handler.read_items, item_uuids, model_type, include_fields, exclude_fields
+        )
+
+    async def update_item(self, item: PersistableModel) -> dict:
+        return await asyncio.to_thread(self.storage_handler.update_item, item)
+
+    async def update_items(self, items: list[PersistableModel]) -> list[dict]:
+        return await asyncio.to_thread(self.storage_handler.update_items, items)
+
+    async def update_fields(self, item_uuid: UUID, model_type: str, fields: dict) -> dict:
+        return await asyncio.to_thread(self.storage_handler.update_fields, item_uuid, model_type, fields)
+
+    async def bulk_update_fields(self, fields_by_uuid: dict[UUID, dict], model_type: str) -> list[dict]:
+        return await asyncio.to_thread(self.storage_handler.bulk_update_fields, fields_by_uuid, model_type)
+
+    async def delete_item(self, item: PersistableModel) -> dict:
+        return await asyncio.to_thread(self.storage_handler.delete_item, item)
+
+    async def delete_items(self, items: list[PersistableModel]) -> Optional[dict]:
+        return await asyncio.to_thread(self.storage_handler.delete_items, items)
+
+    async def read_all_items(
+        self,
+        model_type: str,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[PersistableModel]:
+        return await asyncio.to_thread(
+            self.storage_handler.read_all_items, model_type, user_uuid, include_fields, exclude_fields
+        )
+
+    async def list_all_items(self, model_type: str, user_uuid: UUID) -> list[UUID]:
+        return await asyncio.to_thread(self.storage_handler.list_all_items, model_type, user_uuid)
+
+    async def get_file_chunks(
+        self,
+        parent_file_uuid: UUID,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[Chunk]:
+        return await asyncio.to_thread(
+            self.storage_handler.get_file_chunks, parent_file_uuid, user_uuid, include_fields, exclude_fields
+        )
+
+    async def get_file_status(
+        self,
+        file_uuid: UUID,
+        user_uuid: UUID,
+        include_chunk_statuses: bool = False,
+        chunk_statuses_offset: int = 0,
+        chunk_statuses_limit: int = 100,
+    ) -> FileStatus:
+        return await asyncio.to_thread(
+            self.storage_handler.get_file_status,
+            file_uuid,
+            user_uuid,
+            include_chunk_statuses,
+            chunk_statuses_offset,
+            chunk_statuses_limit,
+        )
+
+    async def search_chunks(
+        self, query_vector: list[float], user_uuid: UUID, k: int = 4, fields: Optional[list[str]] = None
+    ) -> list[dict]:
+        return await asyncio.to_thread(self.storage_handler.search_chunks, query_vector, user_uuid, k, fields)
@@ -1,9 +1,18 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 from uuid import UUID
 
-from redbox.models import Chunk, File, SpotlightComplete
+from redbox.models import Chunk, File, FileStatus, SpotlightComplete
 from redbox.models.base import PersistableModel
 
+# Elasticsearch's default index.max_result_window, chunk statuses past this can't be paged with from and size
+MAX_CHUNK_STATUSES_WINDOW = 10_000
+
+
+class ItemNotFoundError(LookupError):
+    """An item is not in the data store, for storage handlers whose client does not
+    have its own error for this, as Elasticsearch has NotFoundError"""
+
 
 class BaseStorageHandler(ABC):
     """Abstract Class for Storage Handler which manages all file and object IO
@@ -19,6 +28,13 @@ class BaseStorageHandler(ABC):
     def get_model_by_model_type(self, model_type):
         return self.model_type_map[model_type.lower()]
 
+    def get_source_includes(self, model_type: str, include_fields: list[str]) -> list[str]:
+        """The fields to read when only `include_fields` are requested, these are
+        always extended with the fields needed to construct a valid model"""
+        model = self.get_model_by_model_type(model_type)
+        required_fields = {name for name, field in model.model_fields.items() if field.is_required()}
+        return sorted(set(PersistableModel.model_fields) | required_fields | set(include_fields))
+
     @abstractmethod
     def __init__(self):
         """Initialise the storage handler"""
@@ -36,8 +52,14 @@ class BaseStorageHandler(ABC):
         """Read an object from a data store"""
 
     @abstractmethod
-    def read_items(self, item_uuids: list[UUID], model_type: str):
-        """Read a list of objects from a data store"""
+    def read_items(
+        self,
+        item_uuids: list[UUID],
+        model_type: str,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ):
+        """Read a list of objects from a data store, optionally only reading the given fields"""
 
     @abstractmethod
     def update_item(self, item: PersistableModel):
@@ -47,6 +69,14 @@ class BaseStorageHandler(ABC):
     def update_items(self, items: list[PersistableModel]):
         """Update a list of objects in a data store"""
 
+    @abstractmethod
+    def update_fields(self, item_uuid: UUID, model_type: str, fields: dict):
+        """Update only the given fields of an object in a data store"""
+
+    @abstractmethod
+    def bulk_update_fields(self, fields_by_uuid: dict[UUID, dict], model_type: str):
+        """Update only the given fields of a number of objects in a data store"""
+
     @abstractmethod
     def delete_item(self, item: PersistableModel):
         """Delete an object from a data store"""
@@ -60,9 +90,35 @@ class BaseStorageHandler(ABC):
         """List all objects of a given type from a data store"""
 
     @abstractmethod
-    def read_all_items(self, model_type: str, user_uuid: UUID):
-        """Read all objects of a given type from a data store"""
+    def read_all_items(
+        self,
+        model_type: str,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ):
+        """Read all objects of a given type from a data store, optionally only reading the given fields"""
+
+    @abstractmethod
+    def get_file_chunks(
+        self,
+        parent_file_uuid: UUID,
+        user_uuid: UUID,
+        include_fields: Optional[list[str]] = None,
+        exclude_fields: Optional[list[str]] = None,
+    ) -> list[Chunk]:
+        """get chunks for a given file, optionally only reading the given fields"""
 
     @abstractmethod
-    def get_file_chunks(self, parent_file_uuid: UUID, user_uuid: UUID) -> list[Chunk]:
-        """get chunks for a given file"""
+    def get_file_status(
+        self,
+        file_uuid: UUID,
+        user_uuid: UUID,
+        include_chunk_statuses: bool = False,
+        chunk_statuses_offset: int = 0,
+        chunk_statuses_limit: int = 100,
+    ) -> FileStatus:
+        """Get the status of a file from its chunks, optionally with a page of chunk statuses
+
+        `chunk_statuses_offset + chunk_statuses_limit` should be no more than MAX_CHUNK_STATUSES_WINDOW
+        """
@@ -1,17 +1,23 @@
 import os
-from typing import Generator, TypeVar
+from typing import AsyncGenerator, Generator, TypeVar
+from unittest.mock import Mock
 from uuid import uuid4
 
+import orjson
 import pytest
+import pytest_asyncio
 from botocore.exceptions import ClientError
+from elastic_transport import ObjectApiResponse
 from elasticsearch import Elasticsearch
 
 from redbox.models import Chunk, File, Settings
+from redbox.storage.async_elasticsearch import AsyncElasticsearchStorageHandler
 from redbox.storage.elasticsearch import ElasticsearchStorageHandler
 
 T = TypeVar("T")
 
 YieldFixture = Generator[T, None, None]
+AsyncYieldFixture = AsyncGenerator[T, None]
 
 
 @pytest.fixture
@@ -164,3 +170,42 @@ def elasticsearch_client(env) -> YieldFixture[Elasticsearch]:
 @pytest.fixture
 def elasticsearch_storage_handler(elasticsearch_client) -> YieldFixture[ElasticsearchStorageHandler]:
     yield ElasticsearchStorageHandler(es_client=elasticsearch_client, root_index="redbox-test-data")
+
+
+@pytest_asyncio.fixture
+async def async_elasticsearch_storage_handler(env) -> AsyncYieldFixture[AsyncElasticsearchStorageHandler]:
+    es_client = env.async_elasticsearch_client()
+    yield AsyncElasticsearchStorageHandler(es_client=es_client, root_index="redbox-test-data")
+    await es_client.close()
+
+
+class FakeBulk:
+    """A _bulk API that rejects the second of the chunks with a 429 the first time, and always
+    fails the third with a 400, recording the ids sent in each request"""
+
+    def __init__(self, chunks: list[Chunk]):
+        self.chunks = chunks
+        self.sent: list[list[str]] = []
+
+    def __call__(self, operations: list[bytes]) -> ObjectApiResponse:
+        # chunks have an index field too, but it isn't an action header
+        headers = [op["index"] for op in map(orjson.loads, operations) if isinstance(op.get("index"), dict)]
+        self.sent.append([header["_id"] for header in headers])
+
+        statuses = {str(self.chunks[1].uuid): 429 if len(self.sent) == 1 else 201, str(self.chunks[2].uuid): 400}
+        items = []
+        for header in headers:
+            status = statuses.get(header["_id"], 201)
+            items.append({"index": {"_id": header["_id"], "status": status} | ({"error": {}} if status >= 400 else {})})
+        return ObjectApiResponse(body={"errors": True, "items": items}, meta=Mock())
+
+
+@pytest.fixture
+def fake_bulk() -> YieldFixture[FakeBulk]:
+    creator_user_uuid = uuid4()
+    yield FakeBulk(
+        [
+            Chunk(creator_user_uuid=creator_user_uuid, parent_file_uuid=uuid4(), index=i, text="test_text")
+            for i in range(3)
+        ]
+    )
@@ -0,0 +1,69 @@
+from uuid import uuid4
+
+from langchain_core.documents import Document
+
+from redbox.llm.context_packing import pack_documents
+from redbox.models.file import Chunk, encoding
+
+
+def make_document(text: str, **metadata) -> Document:
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_pack_documents_within_budget():
+    documents = [make_document("the quick brown fox"), make_document("jumps over the lazy dog")]
+    token_count = sum(len(encoding.encode(document.page_content)) for document in documents)
+
+    packed, tokens_used = pack_documents(documents, token_budget=1_000)
+
+    assert packed == documents
+    assert tokens_used == token_count
+
+
+def test_pack_documents_dedupes_on_text_hash():
+    chunk = Chunk(parent_file_uuid=uuid4(), creator_user_uuid=uuid4(), index=0, text="the quick brown fox")
+    documents = [
+        make_document(chunk.text, text_hash=chunk.text_hash, token_count=chunk.token_count),
+        make_document("jumps over the lazy dog"),
+        # no stored hash, but the same text as the first document
+        make_document(chunk.text),
+    ]
+
+    packed, tokens_used = pack_documents(documents, token_budget=1_000)
+
+    assert [document.page_content for document in packed] == [chunk.text, "jumps over the lazy dog"]
+    assert tokens_used == chunk.token_count + len(encoding.encode("jumps over the lazy dog"))
+
+
+def test_pack_documents_uses_stored_token_count():
+    documents = [make_document("the quick brown fox", token_count=600), make_document("jumps", token_count=600)]
+
+    packed, tokens_used = pack_documents(documents, token_budget=1_000, min_truncated_tokens=500)
+
+    assert packed == documents[:1]
+    assert tokens_used == 600
+
+
+def test_pack_documents_truncates_last_document():
+    long_text = " ".join(["word"] * 200)
+    documents = [make_document("the quick brown fox"), make_document(long_text)]
+    first_token_count = len(encoding.encode("the quick brown fox"))
+
+    packed, tokens_used = pack_documents(documents, token_budget=first_token_count + 60, min_truncated_tokens=50)
+
+    assert tokens_used == first_token_count + 60
+    assert packed[1].metadata["truncated"]
+    assert packed[1].metadata["token_count"] == 60
+    assert len(encoding.encode(packed[1].page_content)) <= 60
+    assert long_text.startswith(packed[1].page_content)
+
+
+def test_pack_documents_drops_lower_ranked_documents():
+    long_text = " ".join(["word"] * 200)
+    documents = [make_document(long_text), make_document(long_text + " again"), make_document("short")]
+    long_token_count = len(encoding.encode(long_text))
+
+    packed, tokens_used = pack_documents(documents, token_budget=long_token_count + 10, min_truncated_tokens=50)
+
+    assert packed == documents[:1]
+    assert tokens_used == long_token_count
@@ -0,0 +1,80 @@
+from langchain_community.chat_models import ChatLiteLLM
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from redbox.llm.llm_base import (
+    ChainCache,
+    chain_cache,
+    get_condense_question_chain,
+    get_docs_with_sources_chain,
+    get_spotlight_chains,
+    llm_cache_key,
+)
+from redbox.llm.spotlight.spotlight import key_actions_task, summary_task
+
+
+def test_chain_cache_builds_once():
+    cache = ChainCache()
+    built = []
+
+    def build():
+        built.append(object())
+        return built[-1]
+
+    assert cache.get("key", build) is cache.get("key", build)
+    assert cache.get("other-key", build) is not cache.get("key", build)
+    assert len(built) == 2
+
+
+def test_chain_cache_evicts_least_recently_used():
+    cache = ChainCache(maxsize=2)
+
+    first = cache.get("first", object)
+    cache.get("second", object)
+    assert cache.get("first", object) is first
+    cache.get("third", object)
+
+    # "second" was the least recently used, so it has been evicted and is built again
+    assert cache.get("first", object) is first
+    assert cache.get("second", lambda: "rebuilt") == "rebuilt"
+
+
+def test_chains_reused_per_llm_config():
+    chain_cache.clear()
+    llm = FakeListChatModel(responses=["Hi there"])
+    same_llm = FakeListChatModel(responses=["Hi there"])
+    other_llm = FakeListChatModel(responses=["Bye"])
+
+    condense_question_chain = get_condense_question_chain(llm)
+    assert condense_question_chain.llm is llm
+
+    # calling an LLM moves on its response counter, which doesn't change its configuration
+    assert same_llm.invoke("Hello").content == "Hi there"
+    assert get_condense_question_chain(same_llm) is condense_question_chain
+
+    other_chain = get_condense_question_chain(other_llm)
+    assert other_chain is not condense_question_chain
+    assert other_chain.llm is other_llm
+    assert other_chain.run(question="Hello", chat_history="") == "Bye"
+
+    assert get_docs_with_sources_chain(llm) is get_docs_with_sources_chain(same_llm)
+    assert get_docs_with_sources_chain(other_llm).llm_chain.llm is other_llm
+
+
+def test_llm_cache_key_leaves_out_secrets():
+    llm = ChatLiteLLM(model="gpt-3.5-turbo", openai_api_key="a-secret")
+    same_config_llm = ChatLiteLLM(model="gpt-3.5-turbo", openai_api_key="another-secret")
+
+    assert "secret" not in llm_cache_key(llm)
+    assert llm_cache_key(llm) == llm_cache_key(same_config_llm)
+    assert llm_cache_key(llm) != llm_cache_key(ChatLiteLLM(model="gpt-4", openai_api_key="a-secret"))
+
+
+def test_spotlight_chains_reused_per_task():
+    llm = FakeListChatModel(responses=["Hi there"])
+
+    regular_chain, map_reduce_chain = get_spotlight_chains(llm, summary_task, token_max=100_000)
+    assert get_spotlight_chains(llm, summary_task, token_max=100_000) == (regular_chain, map_reduce_chain)
+    assert regular_chain.llm_chain.prompt == summary_task.prompt_template
+
+    assert get_spotlight_chains(llm, key_actions_task, token_max=100_000)[0] is not regular_chain
+    assert get_spotlight_chains(llm, summary_task, token_max=1_000)[1] is not map_reduce_chain
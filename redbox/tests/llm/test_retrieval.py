@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from redbox.llm.retrieval import maximal_marginal_relevance, reciprocal_rank_fusion
+
+
+def hits(*ids: str) -> list[dict]:
+    return [{"_id": _id, "_score": 1.0, "_source": {"text": _id}} for _id in ids]
+
+
+def test_reciprocal_rank_fusion():
+    bm25_hits = hits("a", "b", "c")
+    knn_hits = hits("c", "a", "d")
+
+    fused = reciprocal_rank_fusion([bm25_hits, knn_hits], rank_constant=60)
+
+    assert [hit["_id"] for hit in fused] == ["a", "c", "b", "d"]
+    assert fused[0]["_score"] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[-1]["_score"] == pytest.approx(1 / 63)
+    assert fused[0]["_source"] == {"text": "a"}
+
+
+def test_reciprocal_rank_fusion_size():
+    fused = reciprocal_rank_fusion([hits("a", "b", "c"), hits("b")], size=2)
+    assert [hit["_id"] for hit in fused] == ["b", "a"]
+
+
+def test_reciprocal_rank_fusion_no_results():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def naive_maximal_marginal_relevance(query, embeddings, k, lambda_mult):
+    def cosine(a, b):
+        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+    # the most relevant candidate is always selected first
+    selected = [max(range(len(embeddings)), key=lambda i: cosine(query, embeddings[i]))]
+    while len(selected) < min(k, len(embeddings)):
+        scores = {
+            i: lambda_mult * cosine(query, embedding)
+            - (1 - lambda_mult) * max(cosine(embedding, embeddings[j]) for j in selected)
+            for i, embedding in enumerate(embeddings)
+            if i not in selected
+        }
+        selected.append(max(scores, key=scores.__getitem__))
+    return selected
+
+
+def test_maximal_marginal_relevance():
+    query = [1.0, 0.0, 0.0]
+    embeddings = [
+        [0.9, 0.4, 0.0],
+        # a near duplicate of the first
+        [0.85, 0.45, 0.0],
+        [0.8, -0.5, 0.0],
+        [0.0, 0.0, 1.0],
+    ]
+
+    assert maximal_marginal_relevance(query, embeddings, k=2, lambda_mult=1.0) == [0, 1]
+    assert maximal_marginal_relevance(query, embeddings, k=2, lambda_mult=0.5) == [0, 2]
+    assert sorted(maximal_marginal_relevance(query, embeddings, k=10)) == [0, 1, 2, 3]
+    assert maximal_marginal_relevance(query, [], k=2) == []
+
+
+def test_maximal_marginal_relevance_leaves_arrays_unchanged():
+    query = np.array([3.0, 4.0], dtype=np.float32)
+    embeddings = np.array([[3.0, 4.0], [0.0, 2.0]], dtype=np.float32)
+
+    assert maximal_marginal_relevance(query, embeddings, k=2) == [0, 1]
+    assert maximal_marginal_relevance(query, np.empty((0, 2), dtype=np.float32), k=2) == []
+
+    np.testing.assert_array_equal(query, [3.0, 4.0])
+    np.testing.assert_array_equal(embeddings, [[3.0, 4.0], [0.0, 2.0]])
+
+
+@pytest.mark.parametrize("lambda_mult", [0.0, 0.25, 0.5, 0.75, 1.0])
+def test_maximal_marginal_relevance_matches_naive(lambda_mult):
+    rng = np.random.default_rng(42)
+    query = rng.normal(size=16)
+    embeddings = rng.normal(size=(50, 16))
+
+    assert maximal_marginal_relevance(query.tolist(), embeddings.tolist(), k=8, lambda_mult=lambda_mult) == (
+        naive_maximal_marginal_relevance(query, embeddings, k=8, lambda_mult=lambda_mult)
+    )
@@ -1,8 +1,11 @@
+import json
 import uuid
 
+import numpy as np
 import pytest
 
-from redbox.models.file import Link, Metadata
+from redbox.models import file
+from redbox.models.file import Chunk, Link, Metadata
 
 UUID_1 = uuid.UUID("7c66416e-eff7-441f-aafc-6f06e62fb4ec")
 UUID_2 = uuid.UUID("b7aadcce-806c-4dc6-8b95-d2477d717560")
@@ -54,3 +57,78 @@ def test_merge_pass_two_parent_doc_uuid():
     with pytest.raises(ValueError) as value_error:
         Metadata.merge(left, right)
     assert value_error.value.args[0] == "chunks do not have the same parent_doc_uuid"
+
+
+def test_chunk_text_hash_and_token_count_computed_once(mocker):
+    chunk = Chunk(parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, index=0, text="the quick brown fox")
+    encode = mocker.spy(file.encoding, "encode")
+
+    assert chunk.model_dump()["token_count"] == chunk.token_count
+    chunk.model_dump_json()
+    chunk.model_dump_json()
+
+    assert encode.call_count == 1
+
+
+def test_chunk_text_hash_and_token_count_follow_text():
+    chunk = Chunk(parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, index=0, text="the quick brown fox")
+    text_hash, token_count = chunk.text_hash, chunk.token_count
+
+    chunk.text = "the quick brown fox jumps over the lazy dog"
+    assert chunk.text_hash != text_hash
+    assert chunk.token_count > token_count
+
+    copied = chunk.model_copy(update={"text": "the quick brown fox"})
+    assert (copied.text_hash, copied.token_count) == (text_hash, token_count)
+
+
+def test_chunk_stored_text_hash_and_token_count_trusted(mocker):
+    chunk = Chunk(parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, index=0, text="the quick brown fox")
+    stored = chunk.model_dump(mode="json")
+    encode = mocker.spy(file.encoding, "encode")
+
+    loaded = Chunk(**stored)
+
+    assert loaded == chunk
+    assert (loaded.text_hash, loaded.token_count) == (stored["text_hash"], stored["token_count"])
+    assert Chunk.model_validate_json(chunk.model_dump_json()).token_count == stored["token_count"]
+    assert encode.call_count == 0
+
+
+def test_chunk_embedding_is_float32():
+    """
+    Given the float32 output of an embedding model
+    When I set it as the embedding of a chunk
+    I Expect it to be kept as the same float32 array, and a list of floats to be converted to one
+    """
+    encoded = np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], dtype=np.float32)
+    chunk = Chunk(text="hello", index=0, parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, embedding=encoded[1])
+    assert np.shares_memory(chunk.embedding, encoded)
+
+    chunk = Chunk(text="hello", index=0, parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, embedding=[0.4, 0.5, 0.6])
+    assert chunk.embedding.dtype == np.float32
+    assert np.array_equal(chunk.embedding, encoded[1])
+
+
+@pytest.mark.parametrize("embedding_format", ["float", "base64"])
+def test_chunk_embedding_round_trip(embedding_format):
+    """
+    Given a chunk with an embedding
+    When I serialise it with either embedding format and read it back
+    I Expect the same chunk, with a writeable embedding
+    """
+    chunk = Chunk(text="hello", index=0, parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, embedding=[0.1, 0.2, 0.3])
+    serialised = chunk.model_dump_json(context={"embedding_format": embedding_format})
+
+    read_chunk = Chunk.model_validate_json(serialised)
+    assert read_chunk == chunk
+    assert read_chunk.embedding.flags.writeable
+    assert isinstance(json.loads(serialised)["embedding"], list if embedding_format == "float" else str)
+
+
+def test_chunk_equality_compares_embeddings():
+    left = Chunk(text="hello", index=0, parent_file_uuid=UUID_1, creator_user_uuid=UUID_2, embedding=[0.1, 0.2])
+    right = left.model_copy(update={"embedding": np.array([0.1, 0.2], dtype=np.float32)})
+    assert left == right
+    assert left != right.model_copy(update={"embedding": np.array([0.2, 0.1], dtype=np.float32)})
+    assert left != right.model_copy(update={"embedding": None})
@@ -1,4 +1,16 @@
-from redbox.parsing.chunk_clustering import compute_embed_dist, compute_token_dist, create_pdist
+import numpy as np
+import pytest
+import scipy
+
+from redbox.parsing.chunk_clustering import (
+    compute_adjacent_clusters,
+    compute_embed_dist,
+    compute_hierarchical_clusters,
+    compute_pair_embed_dist,
+    compute_token_dist,
+    create_pdist,
+    merge_embeddings,
+)
 
 
 def test_compute_embed_dist():
@@ -18,3 +30,43 @@ def test_create_pdist():
     pair_embed_dist = [0.1, 0.3, 0.2, 0.4]
     actual = create_pdist(token_counts, pair_embed_dist, 0.2, False)
     assert list(actual) == [32.06, 48.06, 80.08, 40.04, 72.08, 48.08]
+
+
+def test_compute_adjacent_clusters():
+    token_counts = [10, 30, 20, 40]
+    pair_embed_dist = [0, 0.1, 0.3, 0.2]
+    actual = compute_adjacent_clusters(token_counts, pair_embed_dist, 2, 0.2, False)
+    assert list(actual) == [0, 0, 1, 1]
+
+
+@pytest.mark.parametrize("use_log", [True, False])
+@pytest.mark.parametrize("seed", range(5))
+def test_compute_adjacent_clusters_matches_hierarchical(seed, use_log):
+    rng = np.random.default_rng(seed)
+    n = 100
+    token_counts = rng.integers(1, 100, n)
+    pair_embed_dist = [0, *rng.random(n - 1)]
+    num_clusters = round(np.sum(token_counts) / 300)
+
+    adjacent = compute_adjacent_clusters(token_counts, pair_embed_dist, num_clusters, 0.2, use_log)
+    hierarchical = compute_hierarchical_clusters(token_counts, pair_embed_dist, num_clusters, 0.2, use_log)
+
+    # both assign increasing labels to runs of neighbouring chunks, so the boundaries should match
+    assert list(np.diff(adjacent)) == list(np.diff(hierarchical))
+
+
+def test_compute_pair_embed_dist():
+    rng = np.random.default_rng(0)
+    embedding = rng.random((10, 8))
+    normalised_embedding = embedding / np.linalg.norm(embedding, axis=1, keepdims=True)
+
+    actual = compute_pair_embed_dist(normalised_embedding)
+
+    expected = [0] + [scipy.spatial.distance.cosine(embedding[i], embedding[i + 1]) for i in range(9)]
+    assert np.allclose(actual, expected)
+
+
+def test_merge_embeddings():
+    normalised_embedding = np.array([[1.0, 0.0], [0.0, 1.0]])
+    actual = merge_embeddings(normalised_embedding, [30, 10])
+    assert np.allclose(actual, np.array([3.0, 1.0]) / np.sqrt(10))
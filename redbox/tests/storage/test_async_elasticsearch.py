@@ -0,0 +1,113 @@
+from uuid import uuid4
+
+import pytest
+from elasticsearch import AsyncElasticsearch, NotFoundError
+
+from redbox.models import Chunk, ProcessingStatusEnum
+from redbox.storage import AsyncElasticsearchStorageHandler
+
+
+@pytest.mark.asyncio
+async def test_async_elastic_write_read_delete_items(async_elasticsearch_storage_handler):
+    """
+    Given that I have a list of items
+    When I call write_items, read_items and delete_items on them
+    Then I expect to see them written to, and deleted from, the database
+    """
+    creator_user_uuid = uuid4()
+    chunks = [
+        Chunk(creator_user_uuid=creator_user_uuid, parent_file_uuid=uuid4(), index=i, text="test_text")
+        for i in range(10)
+    ]
+
+    await async_elasticsearch_storage_handler.write_items(chunks)
+
+    read_chunks = await async_elasticsearch_storage_handler.read_items([chunk.uuid for chunk in chunks], "Chunk")
+    assert read_chunks == chunks
+
+    await async_elasticsearch_storage_handler.delete_items(chunks)
+
+    items_left = await async_elasticsearch_storage_handler.list_all_items("Chunk", creator_user_uuid)
+    assert all(chunk.uuid not in items_left for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_async_elastic_read_all_items(async_elasticsearch_storage_handler, chunk_belonging_to_alice, alice):
+    """
+    Given that a chunk belonging to alice has been saved
+    When I call read_all_items, list_all_items and get_file_chunks as alice
+    Then I expect to see only alice's chunk
+    """
+    await async_elasticsearch_storage_handler.write_item(chunk_belonging_to_alice)
+    await async_elasticsearch_storage_handler.refresh()
+
+    chunks = await async_elasticsearch_storage_handler.read_all_items("Chunk", alice)
+    assert [chunk.uuid for chunk in chunks] == [chunk_belonging_to_alice.uuid]
+
+    assert await async_elasticsearch_storage_handler.list_all_items("Chunk", alice) == [chunk_belonging_to_alice.uuid]
+
+    file_chunks = await async_elasticsearch_storage_handler.get_file_chunks(
+        chunk_belonging_to_alice.parent_file_uuid, alice
+    )
+    assert file_chunks == [chunk_belonging_to_alice]
+    assert not await async_elasticsearch_storage_handler.get_file_chunks(
+        chunk_belonging_to_alice.parent_file_uuid, uuid4()
+    )
+
+    await async_elasticsearch_storage_handler.delete_item(chunk_belonging_to_alice)
+    with pytest.raises(NotFoundError):
+        await async_elasticsearch_storage_handler.read_item(chunk_belonging_to_alice.uuid, "Chunk")
+
+
+@pytest.mark.asyncio
+async def test_async_get_file_status(async_elasticsearch_storage_handler, file_belonging_to_alice, alice):
+    """
+    Given that a file belonging to alice has two chunks, one of which is embedded
+    When I call get_file_status
+    I Expect the counts to reflect this
+    """
+    await async_elasticsearch_storage_handler.write_item(file_belonging_to_alice)
+    chunks = [
+        Chunk(
+            creator_user_uuid=alice,
+            parent_file_uuid=file_belonging_to_alice.uuid,
+            index=i,
+            text="test_text",
+            embedding=[0.1, 0.2, 0.3] if i == 0 else None,
+        )
+        for i in range(2)
+    ]
+    await async_elasticsearch_storage_handler.write_items(chunks)
+    await async_elasticsearch_storage_handler.refresh()
+
+    status = await async_elasticsearch_storage_handler.get_file_status(file_belonging_to_alice.uuid, alice)
+    assert status.processing_status == ProcessingStatusEnum.embedding
+    assert status.chunk_count == 2
+    assert status.embedded_chunk_count == 1
+
+    with pytest.raises(ValueError):
+        await async_elasticsearch_storage_handler.get_file_status(file_belonging_to_alice.uuid, uuid4())
+
+
+@pytest.mark.asyncio
+async def test_async_elastic_write_items_retries_failed_items(mocker, fake_bulk):
+    """
+    Given that a _bulk request rejects one item with a 429 and fails another with a 400
+    When I call write_items
+    Then I expect only the 429 item to be retried, and all results to be returned in order
+    """
+
+    async def bulk(self, *args, operations, **kwargs):
+        return fake_bulk(operations)
+
+    mocker.patch.object(AsyncElasticsearch, "bulk", bulk)
+    storage_handler = AsyncElasticsearchStorageHandler(
+        es_client=AsyncElasticsearch("http://localhost:9200"), root_index="redbox-test-data", bulk_initial_backoff=0
+    )
+
+    results = await storage_handler.write_items(fake_bulk.chunks)
+
+    chunk_ids = [str(chunk.uuid) for chunk in fake_bulk.chunks]
+    assert fake_bulk.sent == [chunk_ids, chunk_ids[1:2]]
+    assert [result["index"]["_id"] for result in results] == chunk_ids
+    assert [result["index"]["status"] for result in results] == [201, 201, 400]
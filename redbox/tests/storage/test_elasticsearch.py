@@ -1,9 +1,10 @@
 from uuid import UUID, uuid4
 
+import numpy as np
 import pytest
-from elasticsearch import NotFoundError
+from elasticsearch import Elasticsearch, NotFoundError
 
-from redbox.models import Chunk
+from redbox.models import Chunk, ProcessingStatusEnum
 from redbox.storage.elasticsearch import ElasticsearchStorageHandler
 
 
@@ -192,3 +193,160 @@ def test_get_file_chunks_fail(
         uuid4(),
     )
     assert not other_chunks
+
+
+def test_elastic_write_items_in_batches(elasticsearch_client):
+    """
+    Given that I have more items than fit in a single _bulk request
+    When I call write_items on them
+    Then I expect to see all of them written to the database
+    """
+    storage_handler = ElasticsearchStorageHandler(
+        es_client=elasticsearch_client, root_index="redbox-test-data", bulk_chunk_size=3
+    )
+    creator_user_uuid = uuid4()
+    chunks = [
+        Chunk(creator_user_uuid=creator_user_uuid, parent_file_uuid=uuid4(), index=i, text="test_text")
+        for i in range(10)
+    ]
+
+    results = storage_handler.write_items(chunks)
+    assert len(results) == len(chunks)
+
+    read_chunks = storage_handler.read_items([chunk.uuid for chunk in chunks], "Chunk")
+    assert read_chunks == chunks
+
+
+def test_elastic_write_items_retries_failed_items(mocker, fake_bulk):
+    """
+    Given that a _bulk request rejects one item with a 429 and fails another with a 400
+    When I call write_items
+    Then I expect only the 429 item to be retried, and all results to be returned in order
+    """
+    mocker.patch.object(Elasticsearch, "bulk", lambda self, *args, operations, **kwargs: fake_bulk(operations))
+    storage_handler = ElasticsearchStorageHandler(
+        es_client=Elasticsearch("http://localhost:9200"), root_index="redbox-test-data", bulk_initial_backoff=0
+    )
+
+    results = storage_handler.write_items(fake_bulk.chunks)
+
+    chunk_ids = [str(chunk.uuid) for chunk in fake_bulk.chunks]
+    assert fake_bulk.sent == [chunk_ids, chunk_ids[1:2]]
+    assert [result["index"]["_id"] for result in results] == chunk_ids
+    assert [result["index"]["status"] for result in results] == [201, 201, 400]
+
+
+def test_elastic_update_fields(elasticsearch_storage_handler, stored_chunk_belonging_to_alice):
+    """
+    Given that I have a saved chunk
+    When I call update_fields with just an embedding
+    Then I expect the embedding to be set and the rest of the chunk unchanged
+    """
+    elasticsearch_storage_handler.update_fields(
+        stored_chunk_belonging_to_alice.uuid, "Chunk", {"embedding": [0.1, 0.2, 0.3]}
+    )
+
+    read_chunk = elasticsearch_storage_handler.read_item(stored_chunk_belonging_to_alice.uuid, "Chunk")
+    assert read_chunk.embedding.tolist() == pytest.approx([0.1, 0.2, 0.3])
+    assert read_chunk.text == stored_chunk_belonging_to_alice.text
+    assert read_chunk.parent_file_uuid == stored_chunk_belonging_to_alice.parent_file_uuid
+
+
+def test_elastic_bulk_update_fields(elasticsearch_storage_handler):
+    """
+    Given that I have several saved chunks
+    When I call bulk_update_fields with an embedding for each of them
+    Then I expect every chunk to have its own embedding
+    """
+    creator_user_uuid = uuid4()
+    chunks = [
+        Chunk(creator_user_uuid=creator_user_uuid, parent_file_uuid=uuid4(), index=i, text="test_text")
+        for i in range(5)
+    ]
+    elasticsearch_storage_handler.write_items(chunks)
+
+    elasticsearch_storage_handler.bulk_update_fields(
+        {chunk.uuid: {"embedding": [float(chunk.index)] * 3} for chunk in chunks}, "Chunk"
+    )
+
+    read_chunks = elasticsearch_storage_handler.read_items([chunk.uuid for chunk in chunks], "Chunk")
+    assert [chunk.embedding.tolist() for chunk in read_chunks] == [[float(i)] * 3 for i in range(5)]
+
+
+def test_get_file_status(elasticsearch_storage_handler, file_belonging_to_alice, alice):
+    """
+    Given that a file belonging to alice has three chunks, one of which is embedded
+    When I call get_file_status
+    I Expect the counts to reflect this, and the chunk statuses only when requested
+    """
+    elasticsearch_storage_handler.write_item(file_belonging_to_alice)
+    chunks = [
+        Chunk(
+            creator_user_uuid=alice,
+            parent_file_uuid=file_belonging_to_alice.uuid,
+            index=i,
+            text="test_text",
+            embedding=[0.1, 0.2, 0.3] if i == 0 else None,
+        )
+        for i in range(3)
+    ]
+    elasticsearch_storage_handler.write_items(chunks)
+    elasticsearch_storage_handler.refresh()
+
+    status = elasticsearch_storage_handler.get_file_status(file_belonging_to_alice.uuid, alice)
+    assert status.processing_status == ProcessingStatusEnum.embedding
+    assert status.chunk_count == 3
+    assert status.embedded_chunk_count == 1
+    assert status.chunk_statuses is None
+
+    status = elasticsearch_storage_handler.get_file_status(
+        file_belonging_to_alice.uuid, alice, include_chunk_statuses=True, chunk_statuses_limit=2
+    )
+    assert [chunk_status.chunk_uuid for chunk_status in status.chunk_statuses] == [chunk.uuid for chunk in chunks[:2]]
+    assert [chunk_status.embedded for chunk_status in status.chunk_statuses] == [True, False]
+
+
+def test_get_file_chunks_exclude_fields(elasticsearch_storage_handler):
+    """
+    Given that an embedded chunk has been saved
+    When I call get_file_chunks excluding the embedding, or only including the metadata
+    I Expect the chunk to be returned without its embedding
+    """
+    chunk = Chunk(
+        creator_user_uuid=uuid4(),
+        parent_file_uuid=uuid4(),
+        index=1,
+        text="test_text",
+        embedding=[0.1, 0.2, 0.3],
+    )
+    elasticsearch_storage_handler.write_item(chunk)
+    elasticsearch_storage_handler.refresh()
+
+    for fields in ({"exclude_fields": ["embedding"]}, {"include_fields": ["metadata"]}):
+        chunks = elasticsearch_storage_handler.get_file_chunks(
+            chunk.parent_file_uuid, chunk.creator_user_uuid, **fields
+        )
+        assert len(chunks) == 1
+        assert chunks[0].uuid == chunk.uuid
+        assert chunks[0].text == chunk.text
+        assert chunks[0].embedding is None
+
+    read_chunks = elasticsearch_storage_handler.read_items([chunk.uuid], "Chunk", include_fields=["embedding"])
+    assert np.array_equal(read_chunks[0].embedding, chunk.embedding)
+
+
+def test_get_source_includes(elasticsearch_storage_handler):
+    """
+    Given that I want to read only the embedding of a Chunk
+    When I call get_source_includes
+    I Expect the fields needed to construct a valid Chunk to be included too
+    """
+    assert elasticsearch_storage_handler.get_source_includes("Chunk", ["embedding"]) == [
+        "created_datetime",
+        "creator_user_uuid",
+        "embedding",
+        "index",
+        "parent_file_uuid",
+        "text",
+        "uuid",
+    ]
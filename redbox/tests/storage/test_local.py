@@ -0,0 +1,157 @@
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from redbox.models import Chunk, File, FileStatus, ProcessingStatusEnum
+from redbox.storage import InMemoryStorageHandler, ItemNotFoundError, SQLiteStorageHandler, ThreadedStorageHandler
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def local_storage_handler(request, tmp_path):
+    if request.param == "memory":
+        storage_handler = InMemoryStorageHandler(root_index="redbox-test-data")
+    else:
+        storage_handler = SQLiteStorageHandler(str(tmp_path / "redbox.sqlite3"), root_index="redbox-test-data")
+    yield storage_handler
+    storage_handler.close()
+
+
+def make_chunks(file: File, count: int) -> list[Chunk]:
+    return [
+        Chunk(creator_user_uuid=file.creator_user_uuid, parent_file_uuid=file.uuid, index=i, text=f"test_text {i}")
+        for i in range(count)
+    ]
+
+
+def test_local_write_read_delete_items(local_storage_handler):
+    """
+    Given that I have a list of items
+    When I call write_items, read_items and delete_items on them
+    Then I expect to see them written to, and deleted from, the store
+    """
+    file = File(key="test.pdf", bucket="test", creator_user_uuid=uuid4())
+    chunks = make_chunks(file, 5)
+
+    local_storage_handler.write_items(chunks)
+
+    assert local_storage_handler.read_items([chunk.uuid for chunk in chunks], "Chunk") == chunks
+    assert local_storage_handler.read_item(chunks[0].uuid, "Chunk") == chunks[0]
+    assert sorted(local_storage_handler.list_all_items("Chunk", file.creator_user_uuid)) == sorted(
+        chunk.uuid for chunk in chunks
+    )
+    assert not local_storage_handler.list_all_items("Chunk", uuid4())
+
+    local_storage_handler.delete_items(chunks[1:])
+    assert local_storage_handler.list_all_items("Chunk", file.creator_user_uuid) == [chunks[0].uuid]
+
+    local_storage_handler.delete_item(chunks[0])
+    with pytest.raises(ItemNotFoundError):
+        local_storage_handler.read_item(chunks[0].uuid, "Chunk")
+    with pytest.raises(ItemNotFoundError):
+        local_storage_handler.delete_item(chunks[0])
+
+
+def test_local_fields(local_storage_handler):
+    """
+    Given that I have saved chunks
+    When I update their embeddings, and read them with or without their embeddings
+    Then I expect to see only the fields asked for
+    """
+    file = File(key="test.pdf", bucket="test", creator_user_uuid=uuid4())
+    chunks = make_chunks(file, 3)
+    local_storage_handler.write_items(chunks)
+
+    local_storage_handler.bulk_update_fields(
+        {chunk.uuid: {"embedding": np.full(3, chunk.index, dtype=np.float32)} for chunk in chunks}, "Chunk"
+    )
+
+    read_chunks = local_storage_handler.get_file_chunks(file.uuid, file.creator_user_uuid)
+    assert [chunk.embedding.tolist() for chunk in read_chunks] == [[float(i)] * 3 for i in range(3)]
+    assert [chunk.text for chunk in read_chunks] == [chunk.text for chunk in chunks]
+
+    for fields in ({"exclude_fields": ["embedding"]}, {"include_fields": ["metadata"]}):
+        read_chunks = local_storage_handler.get_file_chunks(file.uuid, file.creator_user_uuid, **fields)
+        assert all(chunk.embedding is None for chunk in read_chunks)
+
+    assert not local_storage_handler.get_file_chunks(file.uuid, uuid4())
+
+    with pytest.raises(ItemNotFoundError):
+        local_storage_handler.update_fields(uuid4(), "Chunk", {"text": "missing"})
+
+
+def test_local_get_file_status(local_storage_handler):
+    """
+    Given that a file has three chunks, one of which is embedded
+    When I call get_file_status
+    I Expect the counts to reflect this, and the chunk statuses only when requested
+    """
+    file = File(key="test.pdf", bucket="test", creator_user_uuid=uuid4())
+    local_storage_handler.write_item(file)
+
+    status = local_storage_handler.get_file_status(file.uuid, file.creator_user_uuid)
+    assert status.processing_status == ProcessingStatusEnum.chunking
+
+    chunks = make_chunks(file, 3)
+    chunks[0].embedding = np.array([0.1, 0.2, 0.3], dtype=np.float32)
+    local_storage_handler.write_items(chunks)
+
+    status = local_storage_handler.get_file_status(file.uuid, file.creator_user_uuid)
+    assert status.processing_status == ProcessingStatusEnum.embedding
+    assert status.chunk_count == 3
+    assert status.embedded_chunk_count == 1
+    assert status.chunk_statuses is None
+
+    status = local_storage_handler.get_file_status(
+        file.uuid, file.creator_user_uuid, include_chunk_statuses=True, chunk_statuses_offset=0, chunk_statuses_limit=2
+    )
+    assert [chunk_status.chunk_uuid for chunk_status in status.chunk_statuses] == [chunk.uuid for chunk in chunks[:2]]
+    assert [chunk_status.embedded for chunk_status in status.chunk_statuses] == [True, False]
+
+    with pytest.raises(ValueError):
+        local_storage_handler.get_file_status(file.uuid, uuid4())
+    with pytest.raises(ValueError):
+        local_storage_handler.get_file_status(uuid4(), file.creator_user_uuid)
+
+
+def test_local_search_chunks(local_storage_handler):
+    """
+    Given that a user has embedded chunks, and another user has a chunk closer to the query
+    When I search the first user's chunks
+    I Expect their k nearest chunks, most similar first, as Elasticsearch hits
+    """
+    file = File(key="test.pdf", bucket="test", creator_user_uuid=uuid4())
+    chunks = make_chunks(file, 4)
+    embeddings = [[1.0, 0.0], [0.6, 0.8], [0.0, 1.0], [-1.0, 0.0]]
+    for chunk, embedding in zip(chunks, embeddings, strict=True):
+        chunk.embedding = np.array(embedding, dtype=np.float32)
+    other_file = File(key="other.pdf", bucket="test", creator_user_uuid=uuid4())
+    other_chunk = make_chunks(other_file, 1)[0]
+    other_chunk.embedding = np.array([0.0, 1.0], dtype=np.float32)
+    local_storage_handler.write_items([*chunks, other_chunk, make_chunks(file, 5)[4]])
+
+    hits = local_storage_handler.search_chunks([0.0, 2.0], file.creator_user_uuid, k=2, fields=["text"])
+
+    assert [hit["_id"] for hit in hits] == [str(chunks[2].uuid), str(chunks[1].uuid)]
+    assert [hit["_score"] for hit in hits] == pytest.approx([1.0, 0.8])
+    assert hits[0]["_source"] == {"text": chunks[2].text}
+
+
+@pytest.mark.asyncio
+async def test_threaded_storage_handler():
+    """
+    Given a sync storage handler wrapped in a ThreadedStorageHandler
+    When I await its methods
+    I Expect the results of the sync storage handler
+    """
+    storage_handler = ThreadedStorageHandler(InMemoryStorageHandler(root_index="redbox-test-data"))
+    file = File(key="test.pdf", bucket="test", creator_user_uuid=uuid4())
+
+    await storage_handler.write_item(file)
+
+    assert await storage_handler.read_item(file.uuid, "File") == file
+    assert await storage_handler.read_all_items("File", file.creator_user_uuid) == [file]
+    assert await storage_handler.get_file_status(file.uuid, file.creator_user_uuid) == FileStatus(
+        file_uuid=file.uuid, processing_status=ProcessingStatusEnum.chunking, chunk_count=0, embedded_chunk_count=0
+    )
+    assert storage_handler.root_index == "redbox-test-data"
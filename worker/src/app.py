@@ -1,90 +1,233 @@
 #!/usr/bin/env python
 
+import asyncio
 import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, TypeVar
 
+import torch
 from faststream import Context, ContextRepo, FastStream
-from faststream.redis import RedisBroker
+from faststream.redis import ListSub, RedisBroker
 
 from redbox.model_db import SentenceTransformerDB
 from redbox.models import Chunk, EmbedQueueItem, File, Settings
 from redbox.parsing import chunk_file
-from redbox.storage.elasticsearch import ElasticsearchStorageHandler
+from redbox.storage import AsyncElasticsearchStorageHandler, ThreadedStorageHandler, get_async_storage_handler
 
 start_time = datetime.now()
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
+T = TypeVar("T")
+
 env = Settings()
 
 
 broker = RedisBroker(url=env.redis_url)
 
-publisher = broker.publisher(list=env.embed_queue_name)
+ingest_max_workers = (
+    env.ingest_clustering_max_workers if env.ingest_embedding_mode == "clustering" else env.ingest_max_workers
+)
+
+
+def set_torch_threads(num_threads: int) -> None:
+    """Runs in each new ingest process, so that the processes share the cores rather than each
+    running as many torch threads as there are cores"""
+    torch.set_num_threads(num_threads)
+
+
+class IngestPool:
+    """The process pool that files are partitioned in
+
+    When one of its processes dies, e.g. killed for running out of memory on a large file, a
+    ProcessPoolExecutor is broken for good, failing every file given to it after. So the pool is
+    replaced when that happens, and the files that were running in it are tried once more.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn, rather than fork, as the parent already has an event loop and torch threads running
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=set_torch_threads,
+            initargs=(max(1, (os.cpu_count() or 1) // self.max_workers),),
+        )
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> None:
+        # every file running in the pool sees it break, only the first replaces it
+        if self.executor is broken:
+            logging.warning("ingest process pool is broken, replacing it")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._create_executor()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+
+        # whichever file broke the pool, this one is tried once more in the new pool
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+            raise
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
 
 
 @asynccontextmanager
 async def lifespan(context: ContextRepo):
-    es = env.elasticsearch_client()
-    storage_handler = ElasticsearchStorageHandler(es_client=es, root_index="redbox-data")
+    storage_handler = get_async_storage_handler(env, root_index="redbox-data")
     model = SentenceTransformerDB(env.embedding_model)
 
+    ingest_pool = IngestPool(max_workers=ingest_max_workers)
+
     context.set_global("storage_handler", storage_handler)
     context.set_global("model", model)
+    context.set_global("ingest_pool", ingest_pool)
 
     yield
 
+    ingest_pool.shutdown()
+    await storage_handler.close()
 
-@broker.subscriber(list=env.ingest_queue_name)
-async def ingest(
-    file: File,
-    storage_handler: ElasticsearchStorageHandler = Context(),
-):
-    """
-    1. Chunks file
-    2. Puts chunks to ES
-    3. Acknowledges message
-    4. Puts chunk on embedder-queue
+
+@lru_cache
+def get_clustering_model() -> SentenceTransformerDB:
+    return SentenceTransformerDB(env.embedding_model)
+
+
+def chunk_and_embed_file(file: File) -> list[Chunk]:
+    """chunk_file, clustering the chunks and embedding them in the same pass
+
+    This runs in the ingest process pool, so the model is loaded once per pool process
+    rather than being pickled with every file.
     """
+    return chunk_file(file, embedding_model=get_clustering_model(), embed_chunks=True)
+
 
+async def ingest_file(
+    file: File,
+    storage_handler: AsyncElasticsearchStorageHandler | ThreadedStorageHandler,
+    ingest_pool: IngestPool,
+) -> list[dict]:
     logging.info("Ingesting file: %s", file)
 
-    chunks = chunk_file(file=file)  # , embedding_model=embedding_model)
+    # partitioning is CPU bound, so it is run in another process to keep the event loop free
+    if env.ingest_embedding_mode == "clustering":
+        chunks = await ingest_pool.run(chunk_and_embed_file, file)
+    else:
+        chunks = await ingest_pool.run(chunk_file, file)
 
     logging.info("Writing %s chunks to storage for file uuid: %s", len(chunks), file.uuid)
 
-    items = storage_handler.write_items(chunks)
+    items = await storage_handler.write_items(chunks)
     logging.info("written %s chunks to elasticsearch", len(items))
 
-    for chunk in chunks:
-        queue_item = EmbedQueueItem(chunk_uuid=chunk.uuid)
-        logging.info("Writing chunk to storage for chunk uuid: %s", chunk.uuid)
-        await publisher.publish(queue_item)
+    if env.ingest_embedding_mode == "clustering":
+        logging.info("chunks for file uuid: %s were embedded while clustering", file.uuid)
+        return items
+
+    # a single RPUSH of every chunk, rather than one round-trip per chunk
+    queue_items = [EmbedQueueItem(chunk_uuid=chunk.uuid) for chunk in chunks]
+    if queue_items:
+        await broker.publish_batch(*queue_items, list=env.embed_queue_name)
+    logging.info("published %s chunks to %s for file uuid: %s", len(queue_items), env.embed_queue_name, file.uuid)
 
     return items
 
 
-@broker.subscriber(list=env.embed_queue_name)
+@broker.subscriber(
+    list=ListSub(
+        env.ingest_queue_name,
+        batch=True,
+        max_records=ingest_max_workers,
+    )
+)
+async def ingest(
+    files: list[File],
+    storage_handler: AsyncElasticsearchStorageHandler | ThreadedStorageHandler = Context(),
+    ingest_pool: IngestPool = Context(),
+):
+    """
+    For up to `ingest_max_workers`, or `ingest_clustering_max_workers`, files at a time, in parallel:
+    1. Chunks file
+    2. Puts chunks to ES
+    3. Acknowledges message
+    4. Puts chunk on embedder-queue
+
+    The next batch of files is only read once every file in this one is done, so one slow
+    file holds up the rest of the queue.
+    """
+
+    results = await asyncio.gather(
+        *(ingest_file(file, storage_handler, ingest_pool) for file in files),
+        return_exceptions=True,
+    )
+    for file, result in zip(files, results, strict=True):
+        if isinstance(result, Exception):
+            logging.error("failed to ingest file: %s", file.uuid, exc_info=result)
+
+    return [result for result in results if not isinstance(result, Exception)]
+
+
+@broker.subscriber(
+    list=ListSub(
+        env.embed_queue_name,
+        batch=True,
+        max_records=env.embed_queue_batch_size,
+        polling_interval=env.embed_queue_poll_interval,
+    )
+)
 async def embed(
-    queue_item: EmbedQueueItem,
-    storage_handler: ElasticsearchStorageHandler = Context(),
+    queue_items: list[EmbedQueueItem],
+    storage_handler: AsyncElasticsearchStorageHandler | ThreadedStorageHandler = Context(),
     model: SentenceTransformerDB = Context(),
 ):
     """
-    1. embed queue-item text
-    2. update related chunk on ES
+    1. read the chunks on the queue, up to `embed_queue_batch_size` of them, from ES in one request
+    2. embed their text in a single batch
+    3. write only the embeddings back to the related chunks on ES
     """
 
-    chunk: Chunk = storage_handler.read_item(queue_item.chunk_uuid, "Chunk")
-    embedded_sentences = model.embed_sentences([chunk.text])
-    if len(embedded_sentences.data) != 1:
-        logging.error("expected just 1 embedding but got %s", len(embedded_sentences.data))
+    chunks: list[Chunk] = await storage_handler.read_items(
+        [item.chunk_uuid for item in queue_items], "Chunk", include_fields=["text"]
+    )
+    if not chunks:
+        return
+
+    # encoding holds the CPU for the whole batch, so it runs in a thread to keep the event loop,
+    # and the ingest subscriber and storage calls on it, free in the meantime
+    loop = asyncio.get_running_loop()
+    embedded_sentences = await loop.run_in_executor(None, model.embed_sentences, [chunk.text for chunk in chunks])
+    if len(embedded_sentences.data) != len(chunks):
+        logging.error("expected %s embeddings but got %s", len(chunks), len(embedded_sentences.data))
         return
-    chunk.embedding = embedded_sentences.data[0].embedding
-    storage_handler.update_item(chunk)
 
-    logging.info("embedded: %s", chunk.uuid)
+    await storage_handler.bulk_update_fields(
+        {
+            chunk.uuid: {"embedding": embedding.embedding.tolist()}
+            for chunk, embedding in zip(chunks, embedded_sentences.data, strict=True)
+        },
+        "Chunk",
+    )
+
+    logging.info("embedded %s chunks", len(chunks))
 
 
 app = FastStream(broker=broker, lifespan=lifespan)
@@ -101,3 +101,19 @@ def stored_chunk(chunk, elasticsearch_storage_handler) -> YieldFixture[Chunk]:
 @pytest.fixture
 def embed_queue_item(stored_chunk) -> YieldFixture[EmbedQueueItem]:
     yield EmbedQueueItem(chunk_uuid=stored_chunk.uuid)
+
+
+@pytest.fixture
+def stored_chunks(elasticsearch_storage_handler) -> YieldFixture[list[Chunk]]:
+    parent_file_uuid, creator_user_uuid = uuid4(), uuid4()
+    chunks = [
+        Chunk(parent_file_uuid=parent_file_uuid, index=i, text=f"test_text {i}", creator_user_uuid=creator_user_uuid)
+        for i in range(5)
+    ]
+    elasticsearch_storage_handler.write_items(chunks)
+    yield chunks
+
+
+@pytest.fixture
+def embed_queue_items(stored_chunks) -> YieldFixture[list[EmbedQueueItem]]:
+    yield [EmbedQueueItem(chunk_uuid=chunk.uuid) for chunk in stored_chunks]
@@ -1,8 +1,13 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from uuid import uuid4
+
 import pytest
 from faststream.redis import TestApp, TestRedisBroker
 
+from redbox.models import EmbedQueueItem, File
 from redbox.storage import ElasticsearchStorageHandler
-from worker.src.app import app, broker, env
+from worker.src.app import IngestPool, app, broker, embed, env
 
 
 @pytest.mark.asyncio
@@ -13,6 +18,7 @@ async def test_ingest_file(s3_client, es_client, embedding_model, file):
     I Expect to see this file to be:
     1. chunked
     2. written to Elasticsearch
+    3. put on the embed queue, one EmbedQueueItem per chunk
     """
 
     storage_handler = ElasticsearchStorageHandler(es_client=es_client, root_index="redbox-data")
@@ -22,12 +28,87 @@ async def test_ingest_file(s3_client, es_client, embedding_model, file):
     async with TestRedisBroker(broker) as br, TestApp(app):
         await br.publish(file, list=env.ingest_queue_name)
 
-        file = storage_handler.read_item(
+        stored_file = storage_handler.read_item(
             item_uuid=file.uuid,
             model_type="File",
         )
 
-        assert file is not None
+        assert stored_file is not None
+
+        storage_handler.refresh()
+        chunks = storage_handler.get_file_chunks(file.uuid, file.creator_user_uuid)
+        queued_chunk_uuids = [
+            EmbedQueueItem.model_validate(item).chunk_uuid
+            for call in embed.mock.call_args_list
+            for item in call.args[0]
+        ]
+
+        assert chunks
+        assert sorted(queued_chunk_uuids) == sorted(chunk.uuid for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_ingest_files_with_one_failure(elasticsearch_storage_handler, file):
+    """
+    Given that I have written a text File to s3, and have a File that isn't on s3
+    When I put several Files on the ingest queue in one batch, the missing one among them
+    I Expect the other Files to be chunked and written to Elasticsearch regardless
+    """
+    files = [
+        file,
+        File(key="missing.pdf", bucket=env.bucket_name, creator_user_uuid=uuid4()),
+        File(key=file.key, bucket=file.bucket, creator_user_uuid=uuid4()),
+    ]
+
+    async with TestRedisBroker(broker) as br, TestApp(app):
+        await br.publish_batch(*files, list=env.ingest_queue_name)
+
+        elasticsearch_storage_handler.refresh()
+        chunks_by_file = [elasticsearch_storage_handler.get_file_chunks(f.uuid, f.creator_user_uuid) for f in files]
+
+        assert chunks_by_file[0]
+        assert not chunks_by_file[1]
+        assert chunks_by_file[2]
+
+
+@pytest.mark.asyncio
+async def test_ingest_pool_replaced_when_broken():
+    """
+    Given an ingest pool
+    When one of its processes dies, breaking the pool
+    I Expect that call to fail, once it has been tried again, and later calls to run in a new pool
+    """
+    ingest_pool = IngestPool(max_workers=1)
+    executor = ingest_pool.executor
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await ingest_pool.run(os._exit, 1)
+
+        assert ingest_pool.executor is not executor
+        assert await ingest_pool.run(abs, -1) == 1
+    finally:
+        ingest_pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_ingest_file_clustering(monkeypatch, elasticsearch_storage_handler, file):
+    """
+    Given that I have written a text File to s3, and INGEST_EMBEDDING_MODE is clustering
+    When I put it on the ingest queue
+    I Expect its chunks to be written to Elasticsearch already embedded,
+    and nothing to be put on the embed queue
+    """
+    monkeypatch.setattr(env, "ingest_embedding_mode", "clustering")
+
+    async with TestRedisBroker(broker) as br, TestApp(app):
+        await br.publish(file, list=env.ingest_queue_name)
+
+        elasticsearch_storage_handler.refresh()
+        chunks = elasticsearch_storage_handler.get_file_chunks(file.uuid, file.creator_user_uuid)
+
+        assert chunks
+        assert all(chunk.embedding is not None for chunk in chunks)
+        embed.mock.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -45,3 +126,20 @@ async def test_embed_item_callback(elasticsearch_storage_handler, embed_queue_it
 
     embedded_chunk = elasticsearch_storage_handler.read_item(embed_queue_item.chunk_uuid, "Chunk")
     assert embedded_chunk.embedding is not None
+
+
+@pytest.mark.asyncio
+async def test_embed_items_callback(elasticsearch_storage_handler, embed_queue_items):
+    """
+    Given that I have created and persisted several chunks to ElasticSearch
+    When I put a batch of embed_queue_items on the queue
+    I Expect to see that all the chunks have been updated with a non null embedding
+    """
+    chunk_uuids = [item.chunk_uuid for item in embed_queue_items]
+
+    async with TestRedisBroker(broker) as br, TestApp(app):
+        await br.publish_batch(*embed_queue_items, list=env.embed_queue_name)
+
+    embedded_chunks = elasticsearch_storage_handler.read_items(chunk_uuids, "Chunk")
+    assert len(embedded_chunks) == len(embed_queue_items)
+    assert all(chunk.embedding is not None for chunk in embedded_chunks)